@@ -3,13 +3,201 @@
 
 import argparse
 import sys
+import logging
 import xml.etree.ElementTree as ET
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
+from struct import unpack_from
+import base64
 import Evtx.Evtx as evtx
 import multiprocessing as mp
 from multiprocessing import Pool, cpu_count
+from contextlib import contextmanager
+import mmap
 import os
+import hashlib
+import pickle
+import glob
+import heapq
+import tempfile
+import time
+import threading
+import queue
+import sqlite3
+import ipaddress
+from bisect import bisect_right
+from collections import deque, OrderedDict
+
+# 库函数（iter_events 等）的提示信息通过 logging 输出，命令行入口把它们打印到标准输出
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_SUPPORT = True
+except ImportError:
+    PARQUET_SUPPORT = False
+
+# EVTX数据块大小
+CHUNK_SIZE = 0x10000
+
+# 并行分析时每个任务包含的数据块数量
+CHUNKS_PER_TASK = 16
+
+# 每个工作进程最多同时保留映射的EVTX文件数
+WORKER_MAPPED_FILES = 16
+
+# 读取线程每次最多连续读取的数据块数，以及最多预读的读取块数（内存中最多保留 16 x 4 个64KB数据块）
+READ_BLOCK_CHUNKS = 16
+READ_AHEAD_BLOCKS = 4
+
+# 写入线程每批写入的结果数，以及队列中最多积压的批数
+WRITE_BATCH_SIZE = 256
+WRITE_QUEUE_SIZE = 64
+
+# 数据块头和记录头标识
+CHUNK_MAGIC = b'ElfChnk\x00'
+RECORD_MAGIC = 0x00002a2a
+
+# 数据块时间索引缓存目录
+INDEX_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.windows_log_analyzer', 'chunk_index')
+
+# 解析事件缓存目录、格式版本和总大小上限
+EVENT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.windows_log_analyzer', 'event_cache')
+EVENT_CACHE_VERSION = 6
+EVENT_CACHE_SIZE_LIMIT = 2 * 1024 * 1024 * 1024
+
+# 增量模式的检查点目录
+CHECKPOINT_DIR = os.path.join(os.path.expanduser('~'), '.windows_log_analyzer', 'checkpoints')
+
+# 输出文件格式和写缓冲区大小
+OUTPUT_FORMATS = ('json', 'ndjson', 'parquet')
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+
+# 时间线模式下每个文件用于纠正局部乱序的重排缓冲区大小（事件条数）
+REORDER_BUFFER_SIZE = 1024
+
+# 匹配结果的默认内存预算，超出时写入磁盘临时文件；估算大小按每条事件和每个额外字段计算
+DEFAULT_MEMORY_BUDGET = 512 * 1024 * 1024
+SPILL_EVENT_SIZE = 256
+SPILL_FIELD_SIZE = 128
+SPILL_BATCH_SIZE = 4096
+
+# 分析器会用到的全部事件数据字段（事件缓存中保存这些字段）
+EVENT_DATA_FIELDS = frozenset([
+    'TargetUserName', 'SubjectUserName', 'TargetDomainName', 'WorkstationName',
+    'IpAddress', 'ProcessName', 'LogonProcessName', 'LogonType', 'TargetLogonId',
+    'Workstation', 'Status',
+])
+
+# 事件数据库中保存的事件数据字段（按列名排序）和表结构，查询按文件进行，索引以文件ID开头
+# field_values 保存账号和IP的不同取值，value_trigrams 是取值（转为小写）的三元组倒排索引
+EVENT_DB_FIELDS = sorted(EVENT_DATA_FIELDS)
+EVENT_DB_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    checkpoint TEXT
+);
+CREATE TABLE IF NOT EXISTS events (
+    file_id INTEGER NOT NULL,
+    record_num INTEGER NOT NULL,
+    timestamp INTEGER NOT NULL,
+    event_id INTEGER NOT NULL,
+    {', '.join(name + (' INTEGER' if name == 'LogonType' else ' TEXT') for name in EVENT_DB_FIELDS)},
+    PRIMARY KEY (file_id, record_num)
+);
+CREATE INDEX IF NOT EXISTS idx_events_event_id ON events (file_id, event_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_events_timestamp ON events (file_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_events_target_user ON events (file_id, TargetUserName);
+CREATE INDEX IF NOT EXISTS idx_events_subject_user ON events (file_id, SubjectUserName);
+CREATE INDEX IF NOT EXISTS idx_events_ip ON events (file_id, IpAddress);
+CREATE INDEX IF NOT EXISTS idx_events_logon_type ON events (file_id, LogonType);
+CREATE TABLE IF NOT EXISTS field_values (
+    id INTEGER PRIMARY KEY,
+    field TEXT NOT NULL,
+    value TEXT NOT NULL,
+    UNIQUE (field, value)
+);
+CREATE TABLE IF NOT EXISTS value_trigrams (
+    trigram TEXT NOT NULL,
+    value_id INTEGER NOT NULL,
+    PRIMARY KEY (trigram, value_id)
+) WITHOUT ROWID;
+"""
+
+# 建立子串倒排索引的字段：账号同时包括目标账号和主体账号
+VALUE_INDEX_FIELDS = {
+    'account': ('TargetUserName', 'SubjectUserName'),
+    'ip': ('IpAddress',),
+}
+
+# 输出结果需要的事件数据字段
+OUTPUT_FIELDS = frozenset([
+    'TargetUserName', 'TargetDomainName', 'WorkstationName', 'IpAddress',
+    'ProcessName', 'LogonProcessName', 'LogonType',
+])
+
+# 聚合统计可直接使用的字段名及对应的 EventRecord 属性，其他字段名从额外字段中读取
+AGGREGATE_FIELDS = {
+    'EventID': 'event_id',
+    'TargetUserName': 'account',
+    'TargetDomainName': 'domain',
+    'WorkstationName': 'workstation',
+    'IpAddress': 'ip_address',
+    'ProcessName': 'process_name',
+    'LogonProcessName': 'logon_process',
+    'LogonType': 'logon_type',
+    'Source': 'source',
+}
+
+# 暴力破解检测使用的事件ID、额外字段，以及默认的时间窗口（秒）和告警阈值
+BRUTE_FORCE_EVENT_IDS = (4625, 4771, 4776)
+BRUTE_FORCE_FIELDS = ('Workstation', 'Status')
+BRUTE_FORCE_WINDOW = 300
+BRUTE_FORCE_THRESHOLD = 10
+SPRAY_THRESHOLD = 5
+
+# 会话重建使用的事件ID，以及未结束会话的默认保留时间（秒）
+SESSION_EVENT_IDS = (4624, 4634, 4647)
+SESSION_HORIZON = 24 * 3600
+
+# 输出结果的列名
+RESULT_COLUMNS = ['时间', '事件ID', '事件类型', '账户', '域', '工作站', 'IP地址', '进程名称', '登录进程', '登录类型']
+
+# Parquet输出每批写入的行数，以及使用字典编码的文本列
+PARQUET_BATCH_SIZE = 65536
+PARQUET_DICTIONARY_COLUMNS = ['事件类型', '账户', '域', '工作站', 'IP地址', '进程名称', '登录进程', '登录类型']
+
+# 事件XML命名空间
+EVENT_NAMESPACE = 'http://schemas.microsoft.com/win/2004/08/events/event'
+
+# FILETIME起始时间
+FILETIME_EPOCH = datetime(1601, 1, 1)
+
+# 1970-01-01 对应的FILETIME
+UNIX_EPOCH_FILETIME = 116444736000000000
+
+# 二进制XML令牌
+BXML_END_OF_STREAM = 0x00
+BXML_OPEN_ELEMENT = 0x01
+BXML_CLOSE_START_ELEMENT = 0x02
+BXML_CLOSE_EMPTY_ELEMENT = 0x03
+BXML_CLOSE_ELEMENT = 0x04
+BXML_VALUE = 0x05
+BXML_ATTRIBUTE = 0x06
+BXML_TEMPLATE_INSTANCE = 0x0C
+BXML_NORMAL_SUBSTITUTION = 0x0D
+BXML_CONDITIONAL_SUBSTITUTION = 0x0E
+BXML_FRAGMENT_HEADER = 0x0F
+
+# 二进制XML替换值类型
+BXML_VALUE_TYPE_BXML = 0x21
+BXML_INTEGER_FORMATS = {
+    0x03: '<b', 0x04: '<B', 0x05: '<h', 0x06: '<H',
+    0x07: '<i', 0x08: '<I', 0x09: '<q', 0x0A: '<Q',
+}
+BXML_FLOAT_FORMATS = {0x0B: '<f', 0x0C: '<d'}
 
 # 常见的Windows事件ID及其描述
 EVENT_TYPES = {
@@ -92,353 +280,3167 @@ LOGON_TYPES = {
     11: "缓存交互式登录",
 }
 
-def parse_xml_event(xml_string):
+def parse_xml_event(xml_string, fields=None):
     """
     解析事件的XML数据
-    返回 (事件ID, 事件数据字典, 时间戳)
+    fields 为需要提取的事件数据字段集合，为 None 时提取全部字段；所需字段都找到后不再继续遍历
+    返回 (事件ID, 事件数据字典)，时间戳统一取自记录头
     """
     try:
         root = ET.fromstring(xml_string)
         
         # 定义命名空间
-        namespaces = {'ns': 'http://schemas.microsoft.com/win/2004/08/events/event'}
+        namespaces = {'ns': EVENT_NAMESPACE}
         
         # 从System节点获取EventID和时间
         system_node = root.find('.//ns:System', namespaces)
         if system_node is None:
-            return None, None, None
+            return None, None
             
         event_id_node = system_node.find('.//ns:EventID', namespaces)
         if event_id_node is None:
-            return None, None, None
+            return None, None
             
         event_id = int(event_id_node.text)
         
-        time_created_node = system_node.find('.//ns:TimeCreated', namespaces)
-        if time_created_node is None:
-            timestamp = None
-        else:
-            sys_time = time_created_node.get('SystemTime')
-            if sys_time:
-                try:
-                    timestamp = datetime.strptime(sys_time.split('.')[0], '%Y-%m-%d %H:%M:%S')
-                except:
-                    try:
-                        timestamp = datetime.fromisoformat(sys_time.replace('Z', '+00:00'))
-                    except:
-                        timestamp = None
-            else:
-                timestamp = None
-        
         # 从EventData节点获取事件详细数据
         data = {}
         event_data = root.find('.//ns:EventData', namespaces)
         if event_data is not None:
             for data_item in event_data.findall('.//ns:Data', namespaces):
                 name = data_item.get('Name')
+                if fields is not None and name not in fields:
+                    continue
                 if name and data_item.text:
                     data[name] = data_item.text
+                    if fields is not None and len(data) == len(fields):
+                        break
         
-        return event_id, data, timestamp
+        return event_id, data
     except Exception as e:
-        print(f"解析XML错误: {str(e)}")
-        return None, None, None
+        logger.warning(f"解析XML错误: {str(e)}")
+        return None, None
 
-def process_chunk(chunk_data, event_ids=None, logon_types=None, target_account=None, start_time=None, end_time=None):
+def filetime_to_datetime(filetime):
     """
-    处理事件数据块
+    将FILETIME（自1601-01-01起的100纳秒数）转换为datetime
     """
-    try:
-        print(f"开始处理数据块，包含 {len(chunk_data)} 条记录")
-        results = []
-        event_id_counts = {}
-        event_count = 0
-        filtered_count = 0
-        
-        for i, record in enumerate(chunk_data):
-            try:
-                event_count += 1
-                event_id, data, timestamp = record  # 直接使用已解析的数据
-                
-                if event_id is None:
+    return FILETIME_EPOCH + timedelta(microseconds=filetime // 10)
+
+def format_filetime(filetime):
+    """
+    将FILETIME格式化为输出用的时间字符串，只在写出结果时调用
+    """
+    if filetime is None:
+        return '未知'
+    return filetime_to_datetime(filetime).isoformat(' ', 'microseconds')
+
+def filetime_to_unix_microseconds(filetime):
+    """
+    将FILETIME转换为自1970-01-01起的微秒数
+    """
+    return (filetime - UNIX_EPOCH_FILETIME) // 10
+
+def read_name_string(buf, chunk_offset, name_offset, names):
+    """
+    读取数据块字符串表中的名称，按偏移缓存
+    """
+    name = names.get(name_offset)
+    if name is None:
+        start = chunk_offset + name_offset
+        length = unpack_from('<H', buf, start + 6)[0]
+        name = bytes(buf[start + 8:start + 8 + length * 2]).decode('utf-16-le')
+        names[name_offset] = name
+    return name
+
+def compile_template(buf, chunk_offset, template_offset, names, fields=None, nested=False):
+    """
+    编译数据块中的事件模板，找出 EventID 以及 EventData/Data 各字段对应的替换值序号或字面值
+    Windows 写入的日志中 EventData 通常不在事件模板里，而是根元素下一个嵌套二进制XML（0x21）替换值，
+    其中是另一个模板实例；此时记下该替换值的序号，EventData 的字段由嵌套模板（nested 为真时编译）给出
+    fields 不为 None 时只保留其中的字段，解码时不会读取其余替换值
+    返回 (事件ID引用, 字段列表, 嵌套替换值序号)；模板包含快速路径不支持的结构时返回 None，由调用方回退到XML解析
+    """
+    base = chunk_offset + template_offset
+    pos = base + 0x18
+    end = pos + unpack_from('<I', buf, base + 0x14)[0]
+    
+    event_id = None
+    data_fields = []
+    nested_index = None
+    has_event_data = False
+    # 元素栈: [元素名, 属性字典, 内容列表]
+    stack = []
+    attribute = None
+    
+    while pos < end:
+        token = buf[pos]
+        op = token & 0x0F
+        if op == BXML_END_OF_STREAM:
+            break
+        elif op == BXML_FRAGMENT_HEADER:
+            pos += 4
+        elif op == BXML_OPEN_ELEMENT:
+            element_offset = pos - chunk_offset
+            name_offset = unpack_from('<I', buf, pos + 7)[0]
+            pos += 11
+            if name_offset > element_offset:
+                # 名称字符串内嵌在模板中
+                pos += 10 + unpack_from('<H', buf, pos + 6)[0] * 2
+            if token & 0x40:
+                pos += 4
+            name = read_name_string(buf, chunk_offset, name_offset, names)
+            if stack and stack[-1][0] == 'Data':
+                return None
+            if name == 'EventData':
+                has_event_data = True
+            stack.append([name, {}, []])
+        elif op == BXML_ATTRIBUTE:
+            attribute_offset = pos - chunk_offset
+            name_offset = unpack_from('<I', buf, pos + 1)[0]
+            pos += 5
+            if name_offset > attribute_offset:
+                pos += 10 + unpack_from('<H', buf, pos + 6)[0] * 2
+            attribute = read_name_string(buf, chunk_offset, name_offset, names)
+        elif op == BXML_CLOSE_START_ELEMENT:
+            pos += 1
+        elif op in (BXML_CLOSE_EMPTY_ELEMENT, BXML_CLOSE_ELEMENT):
+            pos += 1
+            if not stack:
+                return None
+            name, attributes, content = stack.pop()
+            parent = stack[-1][0] if stack else None
+            if not stack and attributes.get('xmlns', ('value', EVENT_NAMESPACE) if nested else None) != ('value', EVENT_NAMESPACE):
+                # XML路径按命名空间查找节点，根元素不在该命名空间时交给XML路径处理；嵌套模板沿用外层的命名空间
+                return None
+            if len(content) > 1:
+                if name in ('EventID', 'Data'):
+                    return None
+            elif name == 'EventID' and parent == 'System' and event_id is None:
+                if not content:
+                    return None
+                event_id = content[0]
+            elif name == 'Data' and parent == 'EventData':
+                field = attributes.get('Name')
+                if field is None:
                     continue
-                
-                # 更新事件ID计数
-                event_id_counts[event_id] = event_id_counts.get(event_id, 0) + 1
-                
-                # 检查是否符合时间范围
-                if timestamp:
-                    if start_time and timestamp < start_time:
-                        continue
-                    if end_time and timestamp > end_time:
-                        continue
-                
-                # 如果没有设置任何筛选条件，或者事件ID在筛选列表中
-                if not event_ids or event_id in event_ids:
-                    filtered_count += 1
-                    
-                    # 检查登录类型筛选
-                    if logon_types and data.get('LogonType'):
-                        logon_type = int(data.get('LogonType'))
-                        if logon_type not in logon_types:
-                            continue
-                    
-                    # 检查账号筛选
-                    if target_account:
-                        target_username = data.get('TargetUserName', '')
-                        subject_username = data.get('SubjectUserName', '')
-                        
-                        if not (target_username and target_account.lower() in target_username.lower() or
-                               subject_username and target_account.lower() in subject_username.lower()):
-                            continue
-                    
-                    # 创建事件信息字典
-                    event_info = {
-                        '时间': timestamp.strftime('%Y-%m-%d %H:%M:%S.%f') if timestamp else '未知',
-                        '事件ID': event_id,
-                        '事件类型': get_event_description(event_id),
-                        '账户': data.get('TargetUserName', '未知'),
-                        '域': data.get('TargetDomainName', '未知'),
-                        '工作站': data.get('WorkstationName', '未知'),
-                        'IP地址': data.get('IpAddress', '未知'),
-                        '进程名称': data.get('ProcessName', '未知'),
-                        '登录进程': data.get('LogonProcessName', '未知'),
-                    }
-                    
-                    # 添加登录类型信息
-                    if data.get('LogonType'):
-                        logon_type = int(data.get('LogonType'))
-                        event_info['登录类型'] = f"{logon_type} ({get_logon_type_description(logon_type)})"
-                    
-                    results.append(event_info)
-                
-                if i % 1000 == 0:  # 每处理1000条记录打印一次进度
-                    print(f"已处理 {i + 1}/{len(chunk_data)} 条记录")
-                    
-            except Exception as e:
-                print(f"处理记录时出错: {str(e)}")
+                if field[0] != 'value':
+                    return None
+                if content and field[1] and (fields is None or field[1] in fields):
+                    data_fields.append((field[1], content[0]))
+        elif op == BXML_VALUE:
+            if buf[pos + 1] != 0x01:
+                return None
+            length = unpack_from('<H', buf, pos + 2)[0]
+            value = ('value', bytes(buf[pos + 4:pos + 4 + length * 2]).decode('utf-16-le'))
+            pos += 4 + length * 2
+            if attribute is not None:
+                stack[-1][1][attribute] = value
+                attribute = None
+            elif stack:
+                stack[-1][2].append(value)
+        elif op in (BXML_NORMAL_SUBSTITUTION, BXML_CONDITIONAL_SUBSTITUTION):
+            index, value_type = unpack_from('<HB', buf, pos + 1)
+            pos += 4
+            if value_type == BXML_VALUE_TYPE_BXML:
+                # 只支持根元素下唯一的嵌套二进制XML（EventData 或 UserData）
+                if nested or attribute is not None or len(stack) != 1 or nested_index is not None:
+                    return None
+                nested_index = index
+                continue
+            value = ('sub', index)
+            if attribute is not None:
+                stack[-1][1][attribute] = value
+                attribute = None
+            elif stack:
+                stack[-1][2].append(value)
+        else:
+            # CDATA、实体引用、处理指令等不在快速路径中处理
+            return None
+    
+    if nested:
+        return None, data_fields, None
+    if event_id is None or (nested_index is not None and has_event_data):
+        return None
+    return event_id, data_fields, nested_index
+
+def read_substitution_value(buf, offset, size, value_type):
+    """
+    将替换值数组中的一个值转换为与XML渲染结果一致的字符串
+    不支持的类型抛出 ValueError
+    """
+    if value_type == 0x01:
+        return bytes(buf[offset:offset + size]).decode('utf-16-le').rstrip('\x00')
+    if value_type == 0x00:
+        return ''
+    if value_type in BXML_INTEGER_FORMATS:
+        return str(unpack_from(BXML_INTEGER_FORMATS[value_type], buf, offset)[0])
+    if value_type == 0x15:
+        return '0x%016x' % unpack_from('<Q', buf, offset)[0]
+    if value_type == 0x14:
+        return '0x%08x' % unpack_from('<I', buf, offset)[0]
+    if value_type == 0x13:
+        version, count = buf[offset], buf[offset + 1]
+        high, low = unpack_from('>IH', buf, offset + 2)
+        sub_authorities = unpack_from('<%dI' % count, buf, offset + 8)
+        return f"S-{version}-{(high << 16) ^ low}" + ''.join(f"-{x}" for x in sub_authorities)
+    if value_type == 0x0F:
+        h = bytes(buf[offset:offset + 16])
+        return '{%s-%s-%s-%s-%s}' % (h[3::-1].hex(), h[5:3:-1].hex(), h[7:5:-1].hex(), h[8:10].hex(), h[10:16].hex())
+    if value_type == 0x02:
+        return bytes(buf[offset:offset + size]).decode('ascii').rstrip('\x00')
+    if value_type in BXML_FLOAT_FORMATS:
+        return str(unpack_from(BXML_FLOAT_FORMATS[value_type], buf, offset)[0])
+    if value_type == 0x0D:
+        return 'True' if unpack_from('<i', buf, offset)[0] > 0 else 'False'
+    if value_type == 0x0E:
+        return base64.b64encode(bytes(buf[offset:offset + size])).decode('ascii')
+    if value_type == 0x10:
+        return str(unpack_from('<I' if size == 4 else '<Q', buf, offset)[0])
+    raise ValueError(f"不支持的替换值类型: {value_type:#x}")
+
+def read_substitution_array(buf, chunk_offset, pos, templates, names, fields=None, nested=False):
+    """
+    定位从 pos 开始的二进制XML片段（记录内容或嵌套替换值）中的模板实例和替换值数组，只读取描述符，不解码任何值
+    返回 (模板编译结果, 描述符, 各值偏移)，快速路径无法处理时返回 None
+    """
+    if buf[pos] & 0x0F == BXML_FRAGMENT_HEADER:
+        pos += 4
+    if buf[pos] & 0x0F != BXML_TEMPLATE_INSTANCE:
+        return None
+    
+    template_offset = unpack_from('<I', buf, pos + 6)[0]
+    if template_offset > pos - chunk_offset:
+        # 模板定义紧跟在模板实例之后
+        pos += 10 + 0x18 + unpack_from('<I', buf, chunk_offset + template_offset + 0x14)[0]
+    else:
+        pos += 10
+    
+    # 同一偏移的模板作为嵌套模板编译时结果不同，分开缓存
+    key = (template_offset,) if nested else template_offset
+    if key in templates:
+        plan = templates[key]
+    else:
+        plan = templates[key] = compile_template(buf, chunk_offset, template_offset, names, fields, nested)
+    if plan is None:
+        return None
+    
+    # 替换值数组: 数量、(长度, 类型) 描述符、各个值
+    count = unpack_from('<I', buf, pos)[0]
+    pos += 4
+    descriptors = unpack_from('<' + 'HBx' * count, buf, pos)
+    pos += 4 * count
+    offsets = []
+    for size in descriptors[0::2]:
+        offsets.append(pos)
+        pos += size
+    
+    return plan, descriptors, offsets
+
+def read_template_value(buf, ref, descriptors, offsets):
+    """
+    读取模板中的字面值或替换值
+    """
+    if ref[0] == 'value':
+        return ref[1]
+    index = ref[1]
+    value_type = descriptors[index * 2 + 1]
+    if value_type & 0x80 or value_type == BXML_VALUE_TYPE_BXML:
+        raise ValueError(f"不支持的替换值类型: {value_type:#x}")
+    return read_substitution_value(buf, offsets[index], descriptors[index * 2], value_type)
+
+def read_event_id(buf, plan, descriptors, offsets):
+    """
+    只读取事件ID，用于解码事件数据之前的初筛
+    """
+    event_id_ref = plan[0]
+    if event_id_ref[0] == 'sub':
+        index = event_id_ref[1]
+        value_type = descriptors[index * 2 + 1]
+        if value_type in BXML_INTEGER_FORMATS:
+            return unpack_from(BXML_INTEGER_FORMATS[value_type], buf, offsets[index])[0]
+    return int(read_template_value(buf, event_id_ref, descriptors, offsets))
+    
+def read_event_fields(buf, chunk_offset, located, templates, names, fields=None):
+    """
+    解码 EventData 字段，located 为 read_substitution_array 的返回值；EventData 在嵌套替换值中时先定位嵌套模板
+    返回事件数据字典，遇到不支持的值类型或结构时抛出 ValueError
+    """
+    plan, descriptors, offsets = located
+    event_id_ref, data_fields, nested_index = plan
+    if nested_index is not None:
+        value_type = descriptors[nested_index * 2 + 1]
+        if value_type == 0x00:
+            return {}
+        if value_type != BXML_VALUE_TYPE_BXML:
+            raise ValueError(f"不支持的替换值类型: {value_type:#x}")
+        located = read_substitution_array(buf, chunk_offset, offsets[nested_index], templates, names, fields, True)
+        if located is None:
+            raise ValueError("不支持的嵌套模板")
+        plan, descriptors, offsets = located
+        data_fields = plan[1]
+    
+    data = {}
+    for name, ref in data_fields:
+        value = read_template_value(buf, ref, descriptors, offsets)
+        if value:
+            data[name] = value
+    
+    return data
+
+def datetime_to_filetime(value):
+    """
+    将datetime转换为FILETIME（自1601-01-01起的100纳秒数）
+    """
+    delta = value - FILETIME_EPOCH
+    return (delta.days * 86400 + delta.seconds) * 10000000 + delta.microseconds * 10
+
+class AccountWatchlist:
+    """
+    账号监视列表：用 Aho-Corasick 自动机一次扫描判断文本是否包含任意一个关键字（不区分大小写）
+    匹配开销只与账号长度有关，与关键字数量无关；账号取值重复度高，判断结果按原始文本缓存
+    """
+    __slots__ = ('goto', 'fail', 'output', 'results')
+    
+    def __init__(self, patterns):
+        # goto[状态] 为 {字符: 下一状态}，output[状态] 表示到达该状态时已匹配到某个关键字
+        goto = [{}]
+        output = [False]
+        for pattern in patterns:
+            pattern = pattern.lower()
+            if not pattern:
                 continue
+            state = 0
+            for char in pattern:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    output.append(False)
+                state = next_state
+            output[state] = True
         
-        print(f"数据块处理完成，共处理 {event_count} 条记录，符合条件 {filtered_count} 条")
-        return results, event_id_counts, event_count, filtered_count
+        # 按广度优先顺序计算失败指针，并把失败指针上的匹配结果合并到当前状态
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = goto[fallback].get(char, 0)
+                output[next_state] = output[next_state] or output[fail[next_state]]
         
-    except Exception as e:
-        print(f"处理数据块时出错: {str(e)}")
-        import traceback
-        print("详细错误信息:")
-        print(traceback.format_exc())
-        return [], {}, 0, 0
+        self.goto = goto
+        self.fail = fail
+        self.output = output
+        self.results = {}
+    
+    def match(self, text):
+        result = self.results.get(text)
+        if result is None:
+            result = self.results[text] = self.search(text.lower())
+        return result
+    
+    def search(self, text):
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                return True
+        return False
 
-def save_to_excel(results, output_file):
+class NetworkWatchlist:
     """
-    将分析结果保存为Excel文件
+    IP监视列表：IP地址和CIDR网段按协议版本合并为有序区间，用二分查找判断地址是否落在任意区间内
+    单个地址按完整地址匹配（10.0.0.1 不会匹配 10.0.0.100）；IPv4映射的IPv6地址按IPv4处理
     """
-    if not EXCEL_SUPPORT:
-        raise ImportError("未安装openpyxl库，无法导出Excel文件。请运行 'pip install openpyxl' 安装。")
+    __slots__ = ('starts', 'ends', 'results')
     
-    # 创建工作簿和工作表
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "事件分析结果"
+    def __init__(self, networks):
+        intervals = {4: [], 6: []}
+        for network in networks:
+            try:
+                network = ipaddress.ip_network(network.strip(), strict=False)
+            except ValueError:
+                raise ValueError(f"无效的IP地址或网段: {network}")
+            intervals[network.version].append((int(network.network_address), int(network.broadcast_address)))
+        
+        self.starts = {}
+        self.ends = {}
+        for version, items in intervals.items():
+            items.sort()
+            merged = []
+            for start, end in items:
+                if merged and start <= merged[-1][1] + 1:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            self.starts[version] = [start for start, end in merged]
+            self.ends[version] = [end for start, end in merged]
+        self.results = {}
     
-    # 定义表头
-    headers = ['时间', '事件ID', '事件类型', '账户', '域', '工作站', 'IP地址', '进程名称', '登录进程']
+    def match(self, address):
+        result = self.results.get(address)
+        if result is None:
+            result = self.results[address] = self.contains(address)
+        return result
     
-    # 写入表头
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col)
-        cell.value = header
-        cell.font = Font(bold=True)
-        cell.alignment = Alignment(horizontal='center')
+    def contains(self, address):
+        try:
+            # 去掉IPv6地址的区域标识（如 fe80::1%4）
+            ip = ipaddress.ip_address(address.split('%', 1)[0])
+        except ValueError:
+            return False
+        if ip.version == 6 and ip.ipv4_mapped is not None:
+            ip = ip.ipv4_mapped
+        value = int(ip)
+        index = bisect_right(self.starts[ip.version], value) - 1
+        return index >= 0 and value <= self.ends[ip.version][index]
+
+def load_watchlist(path):
+    """
+    读取监视列表文件，每行一个账号关键字或IP地址/网段，忽略空行和以 # 开头的注释行
+    """
+    entries = []
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                entries.append(line)
+    return entries
+
+class EventFilter:
+    """
+    预编译的筛选条件，每次分析只构建一次，串行和并行路径共用同一个对象
+    事件ID和登录类型转为 frozenset，账号和IP关键字预先转为小写，时间范围预先换算为FILETIME整数
+    fields 为解析时需要提取的事件数据字段：输出字段、调用方额外要求的字段加上筛选条件用到的字段
+    account_watchlist 和 ip_watchlist 为账号关键字和IP地址/网段列表，分别编译为 AccountWatchlist 和 NetworkWatchlist
+    """
+    __slots__ = ('event_ids', 'logon_types', 'target_account', 'target_ip', 'start_time', 'end_time',
+                 'start_filetime', 'end_filetime', 'logon_type_results', 'extra_fields', 'fields',
+                 'account_watchlist', 'ip_watchlist')
+
+    def __init__(self, event_ids=None, logon_types=None, target_account=None, start_time=None, end_time=None, target_ip=None, extra_fields=None,
+                 account_watchlist=None, ip_watchlist=None):
+        self.event_ids = frozenset(event_ids) if event_ids else None
+        self.logon_types = frozenset(logon_types) if logon_types else None
+        self.target_account = target_account.lower() if target_account else None
+        self.target_ip = target_ip.lower() if target_ip else None
+        self.start_time = start_time or None
+        self.end_time = end_time or None
+        
+        # 时间比较精确到秒，结束时间取到该秒的最后一个100纳秒
+        self.start_filetime = None
+        self.end_filetime = None
+        if self.start_time:
+            self.start_filetime = datetime_to_filetime(self.start_time.replace(microsecond=0))
+        if self.end_time:
+            self.end_filetime = datetime_to_filetime(self.end_time.replace(microsecond=0)) + 10000000 - 1
+        
+        # LogonType 的取值很少，缓存每个原始文本的判断结果，避免逐条转换为整数
+        self.logon_type_results = {}
+        
+        # 额外输出的事件数据字段，按原始字段名附加在结果中
+        self.extra_fields = tuple(extra_fields) if extra_fields else ()
+        
+        # 监视列表只编译一次，每条记录的匹配开销不随列表长度增长
+        self.account_watchlist = AccountWatchlist(account_watchlist) if account_watchlist else None
+        self.ip_watchlist = NetworkWatchlist(ip_watchlist) if ip_watchlist else None
+        
+        fields = set(OUTPUT_FIELDS)
+        fields.update(self.extra_fields)
+        if self.logon_types is not None:
+            fields.add('LogonType')
+        if self.target_account is not None or self.account_watchlist is not None:
+            fields.update(('TargetUserName', 'SubjectUserName'))
+        if self.target_ip is not None or self.ip_watchlist is not None:
+            fields.add('IpAddress')
+        self.fields = frozenset(fields)
     
-    # 写入数据
-    for row, event in enumerate(results, 2):
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=row, column=col)
-            cell.value = str(event.get(header, ''))
-            cell.alignment = Alignment(horizontal='center')
+    def match_id_and_time(self, event_id, timestamp):
+        """
+        检查事件ID和时间范围，timestamp 为记录头中的FILETIME
+        """
+        if self.event_ids is not None and event_id not in self.event_ids:
+            return False
+        if timestamp is not None:
+            if self.start_filetime is not None and timestamp < self.start_filetime:
+                return False
+            if self.end_filetime is not None and timestamp > self.end_filetime:
+                return False
+        return True
     
-    # 调整列宽
-    for col in ws.columns:
-        max_length = 0
-        column = col[0].column_letter
-        for cell in col:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = (max_length + 2)
-        ws.column_dimensions[column].width = adjusted_width
+    def match_fields(self, data):
+        """
+        检查登录类型、账号、IP地址和监视列表
+        """
+        if self.logon_types is not None:
+            logon_type = data.get('LogonType')
+            if logon_type:
+                result = self.logon_type_results.get(logon_type)
+                if result is None:
+                    result = self.logon_type_results[logon_type] = int(logon_type) in self.logon_types
+                if not result:
+                    return False
+        
+        if self.target_account is not None:
+            target_username = data.get('TargetUserName')
+            subject_username = data.get('SubjectUserName')
+            if not (target_username and self.target_account in target_username.lower() or
+                    subject_username and self.target_account in subject_username.lower()):
+                return False
+        
+        if self.target_ip is not None:
+            ip_address = data.get('IpAddress')
+            if not (ip_address and self.target_ip in ip_address.lower()):
+                return False
+        
+        if self.account_watchlist is not None:
+            target_username = data.get('TargetUserName')
+            subject_username = data.get('SubjectUserName')
+            if not (target_username and self.account_watchlist.match(target_username) or
+                    subject_username and self.account_watchlist.match(subject_username)):
+                return False
+        
+        if self.ip_watchlist is not None:
+            ip_address = data.get('IpAddress')
+            if not (ip_address and self.ip_watchlist.match(ip_address)):
+                return False
+        
+        return True
+
+class EventRecord:
+    """
+    匹配事件的紧凑表示，重复出现的字符串会被驻留
+    时间保留为FILETIME整数，缺失的字段为 None，中文列名和 '未知' 默认值只在输出时填充
+    同时分析多个文件时 source 为事件的来源文件
+    """
+    __slots__ = ('timestamp', 'event_id', 'account', 'domain', 'workstation', 'ip_address',
+                 'process_name', 'logon_process', 'logon_type', 'extra', 'source')
     
-    # 保存文件
-    wb.save(output_file)
+    def __init__(self, timestamp, event_id, account, domain, workstation, ip_address, process_name, logon_process, logon_type, extra=None, source=None):
+        self.timestamp = timestamp
+        self.event_id = event_id
+        self.account = sys.intern(account) if account else None
+        self.domain = sys.intern(domain) if domain else None
+        self.workstation = sys.intern(workstation) if workstation else None
+        self.ip_address = sys.intern(ip_address) if ip_address else None
+        self.process_name = sys.intern(process_name) if process_name else None
+        self.logon_process = sys.intern(logon_process) if logon_process else None
+        self.logon_type = logon_type
+        self.extra = extra
+        self.source = source
+    
+    def __reduce__(self):
+        # 在进程间传递时按元组序列化，比默认的 __slots__ 状态字典更紧凑
+        return EventRecord, (self.timestamp, self.event_id, self.account, self.domain, self.workstation,
+                             self.ip_address, self.process_name, self.logon_process, self.logon_type, self.extra,
+                             self.source)
+    
+    def to_row(self):
+        """
+        按 RESULT_COLUMNS 的顺序返回各列的值，时间仍为FILETIME
+        """
+        logon_type = None
+        if self.logon_type is not None:
+            logon_type = f"{self.logon_type} ({get_logon_type_description(self.logon_type)})"
+        return (
+            self.timestamp,
+            self.event_id,
+            get_event_description(self.event_id),
+            self.account or '未知',
+            self.domain or '未知',
+            self.workstation or '未知',
+            self.ip_address or '未知',
+            self.process_name or '未知',
+            self.logon_process or '未知',
+            logon_type,
+        )
+    
+    def to_dict(self):
+        """
+        转换为以中文列名为键的事件信息字典，用于JSON输出和界面显示
+        """
+        event_info = dict(zip(RESULT_COLUMNS, self.to_row()))
+        event_info['时间'] = format_filetime(self.timestamp)
+        if event_info['登录类型'] is None:
+            del event_info['登录类型']
+        if self.extra:
+            event_info.update(self.extra)
+        if self.source:
+            event_info['来源文件'] = self.source
+        return event_info
 
-def analyze_events(evtx_file, event_ids=None, logon_types=None, target_account=None, output_file=None, start_time=None, end_time=None, progress_callback=None, target_ip=None):
+def match_event(event_id, data, timestamp, event_filter):
     """
-    分析Windows事件日志
+    按预编译的筛选条件检查单条已解析的事件
+    返回 (是否符合时间和事件ID筛选, EventRecord或None)
     """
-    try:
-        print("正在打开EVTX文件...")
-        with evtx.Evtx(evtx_file) as log:
-            print(f"开始分析事件日志: {evtx_file}")
-            print(f"分析时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    if not event_filter.match_id_and_time(event_id, timestamp):
+        return False, None
+    if not event_filter.match_fields(data):
+        return True, None
+    
+    return True, EventRecord(
+        timestamp,
+        event_id,
+        data.get('TargetUserName'),
+        data.get('TargetDomainName'),
+        data.get('WorkstationName'),
+        data.get('IpAddress'),
+        data.get('ProcessName'),
+        data.get('LogonProcessName'),
+        int(data['LogonType']) if data.get('LogonType') else None,
+        {name: data[name] for name in event_filter.extra_fields if name in data} if event_filter.extra_fields else None,
+    )
+
+def process_records(buf, chunk, event_filter, events=None, record_range=None):
+    """
+    解析并筛选一个数据块中的事件记录
+    时间戳取自记录头中的FILETIME，时间范围之外的记录不做任何解码（也不计入事件ID计数）；
+    其余记录先只读取事件ID，排除不符合事件ID的记录，通过初筛的记录才会完整解码。快速路径无法处理的记录回退到XML渲染后解析
+    传入 events 列表时不做初筛，所有记录的 (事件ID, FILETIME, 事件数据, 记录号) 都追加到其中用于写入缓存或数据库；
+    此时 event_filter 可以为 None，只收集事件不做筛选
+    record_range 为 (起始记录号, 结束记录号) 时只处理记录号大于起始、不大于结束的记录，其余记录不计数（用于增量模式）
+    返回 (结果列表, 事件ID计数, 处理记录数, 符合事件ID筛选的记录数)
+    """
+    results = []
+    event_id_counts = {}
+    event_count = 0
+    filtered_count = 0
+    
+    # 模板和名称字符串的偏移都是相对于数据块的，缓存只在本数据块内有效
+    chunk_offset = chunk.offset()
+    templates = {}
+    names = {}
+    
+    # 初筛条件和需要提取的字段
+    if events is not None:
+        # 写入缓存需要全部记录，以及以后任何查询可能用到的字段
+        event_ids = None
+        start_filetime = None
+        end_filetime = None
+        fields = EVENT_DATA_FIELDS
+    else:
+        event_ids = event_filter.event_ids
+        start_filetime = event_filter.start_filetime
+        end_filetime = event_filter.end_filetime
+        fields = event_filter.fields
+    
+    for record in chunk.records():
+        try:
+            record_offset = record.offset()
+            if record_range is not None:
+                record_num = unpack_from('<Q', buf, record_offset + 0x08)[0]
+                if record_num <= record_range[0] or record_num > record_range[1]:
+                    continue
+            event_count += 1
+            timestamp = unpack_from('<Q', buf, record_offset + 0x10)[0]
+            # 第一阶段：按记录头时间戳初筛，不需要模板
+            if start_filetime is not None and timestamp < start_filetime:
+                continue
+            if end_filetime is not None and timestamp > end_filetime:
+                continue
+            
+            try:
+                located = read_substitution_array(buf, chunk_offset, record_offset + 0x18, templates, names, fields)
+                event_id = read_event_id(buf, *located) if located is not None else None
+            except Exception:
+                event_id = None
             
-            print("正在计算总记录数...")
-            # 获取总记录数
-            total_records = sum(1 for _ in log.records())
-            print(f"总记录数: {total_records}")
-            if progress_callback:
-                progress_callback(10, f"总记录数: {total_records}")
+            if event_id is None:
+                # 快速路径无法处理的记录回退到XML渲染后解析
+                located = None
+                event_id, data = parse_xml_event(record.xml(), fields)
+                if event_id is None:
+                    continue
             
-            print("开始分析记录...")
-            # 初始化结果列表和计数器
-            results = []
-            event_id_counts = {}
-            processed_count = 0
-            filtered_count = 0
+            # 更新事件ID计数
+            event_id_counts[event_id] = event_id_counts.get(event_id, 0) + 1
             
-            # 直接处理所有记录
-            for record in log.records():
+            if located is not None:
+                # 第二阶段：按事件ID初筛，EventData 在嵌套模板中时事件ID仍从外层模板读取
+                if event_ids is not None and event_id not in event_ids:
+                    continue
+                
+                # 第三阶段：完整解码通过初筛的记录
                 try:
-                    processed_count += 1
-                    xml_data = record.xml()
-                    event_id, data, timestamp = parse_xml_event(xml_data)
-                    
+                    data = read_event_fields(buf, chunk_offset, located, templates, names, fields)
+                except Exception:
+                    event_id, data = parse_xml_event(record.xml(), fields)
                     if event_id is None:
                         continue
-                    
-                    # 更新事件ID计数
-                    event_id_counts[event_id] = event_id_counts.get(event_id, 0) + 1
-                    
-                    # 检查是否符合时间范围
-                    if timestamp:
-                        if start_time and timestamp < start_time:
-                            continue
-                        if end_time and timestamp > end_time:
-                            continue
-                    
-                    # 如果没有设置任何筛选条件，或者事件ID在筛选列表中
-                    if not event_ids or event_id in event_ids:
-                        filtered_count += 1
-                        
-                        # 检查登录类型筛选
-                        if logon_types and data.get('LogonType'):
-                            logon_type = int(data.get('LogonType'))
-                            if logon_type not in logon_types:
-                                continue
-                        
-                        # 检查账号筛选
-                        if target_account:
-                            target_username = data.get('TargetUserName', '')
-                            subject_username = data.get('SubjectUserName', '')
-                            
-                            if not (target_username and target_account.lower() in target_username.lower() or
-                                   subject_username and target_account.lower() in subject_username.lower()):
-                                continue
-                        
-                        # 检查IP地址筛选
-                        if target_ip:
-                            ip_address = data.get('IpAddress', '')
-                            if not (ip_address and target_ip.lower() in ip_address.lower()):
-                                continue
-                        
-                        # 创建事件信息字典
-                        event_info = {
-                            '时间': timestamp.strftime('%Y-%m-%d %H:%M:%S.%f') if timestamp else '未知',
-                            '事件ID': event_id,
-                            '事件类型': get_event_description(event_id),
-                            '账户': data.get('TargetUserName', '未知'),
-                            '域': data.get('TargetDomainName', '未知'),
-                            '工作站': data.get('WorkstationName', '未知'),
-                            'IP地址': data.get('IpAddress', '未知'),
-                            '进程名称': data.get('ProcessName', '未知'),
-                            '登录进程': data.get('LogonProcessName', '未知'),
-                        }
-                        
-                        # 添加登录类型信息
-                        if data.get('LogonType'):
-                            logon_type = int(data.get('LogonType'))
-                            event_info['登录类型'] = f"{logon_type} ({get_logon_type_description(logon_type)})"
-                        
-                        results.append(event_info)
-                    
-                    # 更新进度
-                    if processed_count % 1000 == 0:
-                        progress = 10 + int((processed_count / total_records) * 80)
-                        if progress_callback:
-                            progress_callback(progress, f"已处理 {processed_count}/{total_records} 条记录")
-                        print(f"已处理 {processed_count}/{total_records} 条记录")
-                        
-                except Exception as e:
-                    print(f"处理记录时出错: {str(e)}")
-                    continue
             
-            print("分析完成")
-            # 打印事件ID统计信息
-            print("\n事件ID统计:")
-            for event_id, count in sorted(event_id_counts.items(), key=lambda x: x[1], reverse=True):
-                print(f"事件ID {event_id}: {count} 条")
+            if events is not None:
+                events.append((event_id, timestamp, data, unpack_from('<Q', buf, record_offset + 0x08)[0]))
+                if event_filter is None:
+                    continue
             
-            print(f"\n统计信息:")
-            print(f"总事件数: {processed_count}")
-            print(f"符合事件ID筛选的事件数: {filtered_count}")
-            print(f"最终匹配的事件数: {len(results)}")
-
-            # 如果指定了输出文件，将结果保存为JSON
-            if output_file:
-                print(f"正在保存结果到文件: {output_file}")
-                if progress_callback:
-                    progress_callback(90, "正在保存分析结果...")
-                
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    json.dump(results, f, ensure_ascii=False, indent=2, default=str)
-                
-                print(f"\n分析结果已保存到: {output_file}")
+            passed, event_info = match_event(event_id, data, timestamp, event_filter)
+            if passed:
+                filtered_count += 1
+            if event_info is not None:
+                results.append(event_info)
+        
+        except Exception as e:
+            logger.warning(f"处理记录时出错: {str(e)}")
+            continue
+    
+    return results, event_id_counts, event_count, filtered_count
 
-    except Exception as e:
-        print(f"错误: {str(e)}")
-        import traceback
-        print("详细错误信息:")
-        print(traceback.format_exc())
-        sys.exit(1)
+def process_cached_events(record_count, events, event_filter):
+    """
+    筛选从缓存读取的一批事件，不访问EVTX文件
+    返回值与 process_records 相同
+    """
+    results = []
+    event_id_counts = {}
+    filtered_count = 0
+    
+    for event_id, timestamp, data, record_num in events:
+        event_id_counts[event_id] = event_id_counts.get(event_id, 0) + 1
+        passed, event_info = match_event(event_id, data, timestamp, event_filter)
+        if passed:
+            filtered_count += 1
+        if event_info is not None:
+            results.append(event_info)
+    
+    return results, event_id_counts, record_count, filtered_count
 
-def get_event_description(event_id):
+def get_event_cache_path(evtx_file):
     """
-    获取事件ID的描述
+    根据文件路径、大小、修改时间和内容采样哈希计算事件缓存文件路径
+    内容采样为文件头和文件末尾的数据块，日志被追加或覆盖后缓存自动失效
     """
-    return EVENT_TYPES.get(event_id, "未知事件")
+    stat = os.stat(evtx_file)
+    digest = hashlib.sha1()
+    with open(evtx_file, 'rb') as f:
+        digest.update(f.read(0x1000))
+        if stat.st_size > 0x1000 + CHUNK_SIZE:
+            f.seek(-CHUNK_SIZE, os.SEEK_END)
+        digest.update(f.read(CHUNK_SIZE))
+    
+    key = f"{EVENT_CACHE_VERSION}|{os.path.abspath(evtx_file)}|{stat.st_size}|{stat.st_mtime_ns}|{digest.hexdigest()}"
+    return os.path.join(EVENT_CACHE_DIR, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.pkl')
 
-def get_logon_type_description(logon_type):
+def iter_event_cache(cache_path):
     """
-    获取登录类型的描述
+    逐批读取事件缓存，每批为 (记录数, [(事件ID, FILETIME, 事件数据字典), ...])
     """
-    return LOGON_TYPES.get(logon_type, "未知登录类型")
+    with open(cache_path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
 
-def main():
-    parser = argparse.ArgumentParser(description='Windows日志分析工具V1.0')
-    parser.add_argument('evtx_file', help='EVTX日志文件路径')
-    parser.add_argument('--event-ids', type=int, nargs='+', help='要分析的事件ID列表')
-    parser.add_argument('--logon-types', type=int, nargs='+', help='要分析的登录类型列表')
-    parser.add_argument('--account', help='要筛选的特定账号')
-    parser.add_argument('--output', help='输出结果到JSON文件')
-    parser.add_argument('--start-time', help='开始时间 (格式: YYYY-MM-DD HH:MM:SS)')
-    parser.add_argument('--end-time', help='结束时间 (格式: YYYY-MM-DD HH:MM:SS)')
-    parser.add_argument('--list-events', action='store_true', help='列出所有支持的事件ID及其描述')
-    parser.add_argument('--list-logon-types', action='store_true', help='列出所有登录类型及其描述')
-    
-    args = parser.parse_args()
-    
-    if args.list_events:
-        print("支持的事件ID列表:")
-        for event_id, desc in sorted(EVENT_TYPES.items()):
-            print(f"{event_id}: {desc}")
-        return
-    
-    if args.list_logon_types:
-        print("登录类型列表:")
-        for logon_type, desc in sorted(LOGON_TYPES.items()):
-            print(f"{logon_type}: {desc}")
+def open_event_cache(cache_path):
+    """
+    打开临时缓存文件用于写入，全部写完后再由 commit_event_cache 替换为正式缓存
+    无法创建时返回 None，不影响分析
+    """
+    try:
+        os.makedirs(EVENT_CACHE_DIR, exist_ok=True)
+        return open(cache_path + '.tmp', 'wb')
+    except OSError as e:
+        logger.warning(f"创建事件缓存失败: {str(e)}")
+        return None
+
+def commit_event_cache(cache_file, cache_path):
+    """
+    完成缓存写入并按大小上限清理旧缓存
+    """
+    try:
+        cache_file.close()
+        os.replace(cache_file.name, cache_path)
+        logger.info(f"已写入事件缓存: {cache_path}")
+    except OSError as e:
+        logger.warning(f"保存事件缓存失败: {str(e)}")
+    evict_event_cache(EVENT_CACHE_SIZE_LIMIT)
+
+def discard_event_cache(cache_file):
+    """
+    放弃未完成的缓存文件
+    """
+    try:
+        cache_file.close()
+        os.remove(cache_file.name)
+    except OSError:
+        pass
+
+def evict_event_cache(size_limit):
+    """
+    按最近使用时间淘汰事件缓存，使缓存总大小不超过上限
+    命中缓存时会更新文件的修改时间，因此修改时间即最近使用时间
+    """
+    try:
+        entries = []
+        for name in os.listdir(EVENT_CACHE_DIR):
+            if not name.endswith('.pkl'):
+                continue
+            path = os.path.join(EVENT_CACHE_DIR, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+        
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= size_limit:
+                break
+            os.remove(path)
+            total -= size
+            logger.info(f"已淘汰事件缓存: {path}")
+    except OSError as e:
+        logger.warning(f"清理事件缓存失败: {str(e)}")
+
+@contextmanager
+def open_evtx(evtx_file):
+    """
+    以只读内存映射方式打开EVTX文件
+    返回 (映射缓冲区, 文件头)，数据块可直接按序号定位
+    """
+    with open(evtx_file, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield buf, evtx.FileHeader(buf, 0x0)
+        finally:
+            buf.close()
+
+# 工作进程的状态，由 init_worker 设置：预编译的筛选条件，以及已映射的EVTX文件（按最近使用排序）
+worker_filter = None
+worker_files = None
+
+def init_worker(event_filter=None):
+    """
+    进程池的初始化函数：筛选条件在创建工作进程时传入一次，任务中只包含文件路径和数据块序号
+    """
+    global worker_filter, worker_files
+    worker_filter = event_filter
+    worker_files = OrderedDict()
+
+@contextmanager
+def open_worker_evtx(evtx_file):
+    """
+    在工作进程中打开EVTX文件，每个文件在每个工作进程中只映射一次，之后的任务直接从同一映射中读取
+    各进程映射的是同一个文件，由操作系统共享页缓存，记录数据不经过进程间传递；不在进程池中时与 open_evtx 相同
+    """
+    if worker_files is None:
+        with open_evtx(evtx_file) as mapped:
+            yield mapped
+        return
+    
+    mapped = worker_files.pop(evtx_file, None)
+    if mapped is None:
+        with open(evtx_file, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        mapped = (buf, evtx.FileHeader(buf, 0x0))
+        while len(worker_files) >= WORKER_MAPPED_FILES:
+            worker_files.popitem(last=False)[1][0].close()
+    worker_files[evtx_file] = mapped
+    yield mapped
+
+def get_chunk_count(buf, file_header):
+    """
+    获取文件中可用的数据块数量（与FileHeader.chunks()的遍历范围一致）
+    """
+    available = (len(buf) - file_header.header_chunk_size()) // CHUNK_SIZE
+    return max(min(file_header.chunk_count(), available), 0)
+
+def iter_chunks(buf, file_header, chunk_indexes):
+    """
+    按序号依次返回数据块，跳过标识无效的数据块
+    """
+    for index in chunk_indexes:
+        offset = file_header.header_chunk_size() + index * CHUNK_SIZE
+        chunk = evtx.ChunkHeader(buf, offset)
+        if not chunk.check_magic():
+            continue
+        yield chunk
+
+def read_chunk_time_range(buf, chunk_offset):
+    """
+    遍历数据块中的记录头，返回记录时间戳的 (最小值, 最大值)，均为FILETIME
+    只读取每条记录头部的24字节，不解析记录内容；数据块中没有有效记录时返回 None
+    """
+    end = chunk_offset + min(unpack_from('<I', buf, chunk_offset + 0x30)[0], CHUNK_SIZE)
+    offset = chunk_offset + 0x200
+    low = None
+    high = None
+    while offset + 0x18 <= end:
+        magic, size = unpack_from('<II', buf, offset)
+        if magic != RECORD_MAGIC or size < 0x18 or offset + size > end:
+            break
+        filetime = unpack_from('<Q', buf, offset + 0x10)[0]
+        if low is None or filetime < low:
+            low = filetime
+        if high is None or filetime > high:
+            high = filetime
+        offset += size
+    
+    if low is None:
+        return None
+    return low, high
+
+def get_index_cache_path(evtx_file):
+    """
+    获取EVTX文件对应的数据块时间索引缓存路径
+    """
+    key = hashlib.sha1(os.path.abspath(evtx_file).encode('utf-8')).hexdigest()
+    return os.path.join(INDEX_CACHE_DIR, key + '.json')
+
+def load_chunk_time_index(buf, file_header, evtx_file, chunk_count):
+    """
+    读取或构建数据块时间索引，返回各数据块 (最小时间, 最大时间) 的列表，无有效记录的数据块为 None
+    缓存项以数据块头中的记录号、写入位置和数据校验和为键，日志追加或循环覆盖后只重建变化的数据块
+    """
+    cache_path = get_index_cache_path(evtx_file)
+    cached = {}
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f).get('chunks', {})
+    except (OSError, ValueError, AttributeError):
+        cached = {}
+    
+    index = []
+    entries = {}
+    rebuilt = 0
+    for i in range(chunk_count):
+        chunk_offset = file_header.header_chunk_size() + i * CHUNK_SIZE
+        if buf[chunk_offset:chunk_offset + 8] != CHUNK_MAGIC:
+            index.append(None)
+            continue
+        
+        first, last = unpack_from('<QQ', buf, chunk_offset + 0x18)
+        next_offset, checksum = unpack_from('<II', buf, chunk_offset + 0x30)
+        key = f"{first}-{last}-{next_offset}-{checksum:08x}"
+        entry = cached.get(str(i))
+        if entry and entry[0] == key:
+            time_range = tuple(entry[1]) if entry[1] else None
+        else:
+            time_range = read_chunk_time_range(buf, chunk_offset)
+            rebuilt += 1
+        
+        index.append(time_range)
+        entries[str(i)] = [key, list(time_range) if time_range else None]
+    
+    if rebuilt:
+        # 缓存写入失败不影响分析
+        try:
+            os.makedirs(INDEX_CACHE_DIR, exist_ok=True)
+            temp_path = cache_path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'file': os.path.abspath(evtx_file), 'chunks': entries}, f)
+            os.replace(temp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"保存数据块时间索引失败: {str(e)}")
+    
+    logger.info(f"数据块时间索引: {chunk_count} 个数据块，重建 {rebuilt} 个")
+    return index
+
+def select_chunks(buf, file_header, evtx_file, chunk_count, event_filter):
+    """
+    根据时间范围选择需要解析的数据块序号
+    未指定时间范围时返回全部数据块；时间范围与查询窗口没有交集的数据块直接跳过
+    """
+    start_filetime = event_filter.start_filetime
+    end_filetime = event_filter.end_filetime
+    if start_filetime is None and end_filetime is None:
+        return list(range(chunk_count))
+    
+    selected = []
+    for i, time_range in enumerate(load_chunk_time_index(buf, file_header, evtx_file, chunk_count)):
+        if time_range is None:
+            continue
+        low, high = time_range
+        if start_filetime is not None and high < start_filetime:
+            continue
+        if end_filetime is not None and low > end_filetime:
+            continue
+        selected.append(i)
+    return selected
+
+def read_chunk_record_range(buf, chunk_offset):
+    """
+    遍历数据块中的记录头，返回记录号的 (最小值, 最大值)；数据块中没有有效记录时返回 None
+    正在写入的数据块头中的末条记录号可能还没有更新，因此以记录头为准
+    """
+    end = chunk_offset + min(unpack_from('<I', buf, chunk_offset + 0x30)[0], CHUNK_SIZE)
+    offset = chunk_offset + 0x200
+    low = None
+    high = None
+    while offset + 0x18 <= end:
+        magic, size = unpack_from('<II', buf, offset)
+        if magic != RECORD_MAGIC or size < 0x18 or offset + size > end:
+            break
+        record_num = unpack_from('<Q', buf, offset + 0x08)[0]
+        if low is None or record_num < low:
+            low = record_num
+        if high is None or record_num > high:
+            high = record_num
+        offset += size
+    
+    if low is None:
+        return None
+    return low, high
+
+def get_checkpoint_path(evtx_file, checkpoint_key=''):
+    """
+    获取EVTX文件在增量模式下的检查点路径
+    checkpoint_key 用于区分同一文件的不同增量任务（如写入不同的输出文件），各自记录处理进度
+    """
+    key = hashlib.sha1(f"{os.path.abspath(evtx_file)}|{checkpoint_key}".encode('utf-8')).hexdigest()
+    return os.path.join(CHECKPOINT_DIR, key + '.json')
+
+def get_state_path(checkpoint_key=''):
+    """
+    获取增量模式下聚合统计或暴力破解检测状态的保存路径，与检查点一样按 checkpoint_key 区分
+    """
+    key = hashlib.sha1(f"state|{checkpoint_key}".encode('utf-8')).hexdigest()
+    return os.path.join(CHECKPOINT_DIR, key + '.json')
+
+def load_analysis_state(state_path, options):
+    """
+    读取上次增量运行保存的统计或检测状态，不存在或无法读取时返回 None
+    状态中同时记录了最后一轮的检查点：状态先于检查点保存，上次在两者之间中断时按状态补写检查点，
+    使已处理的记录与状态一致；options 与上次运行不同时抛出 ValueError
+    """
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(state, dict) or 'checkpoints' not in state:
+        return None
+    if state.get('options') != options:
+        raise ValueError("聚合统计或暴力破解检测的参数与上次增量运行不同，请使用新的输出文件")
+    for checkpoint_path, checkpoint in state['checkpoints']:
+        if load_checkpoint(checkpoint_path) != checkpoint:
+            save_checkpoint(checkpoint_path, checkpoint)
+    return state
+
+def load_checkpoint(checkpoint_path):
+    """
+    读取检查点，不存在或无法读取时返回 None
+    """
+    try:
+        with open(checkpoint_path, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(checkpoint, dict) or not isinstance(checkpoint.get('last_record'), int):
+        return None
+    return checkpoint
+
+def save_checkpoint(checkpoint_path, checkpoint):
+    """
+    保存检查点，先写入临时文件再替换，不会留下不完整的检查点
+    """
+    try:
+        os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+        temp_path = checkpoint_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f)
+        os.replace(temp_path, checkpoint_path)
+    except OSError as e:
+        logger.warning(f"保存检查点失败: {str(e)}")
+
+def plan_incremental(buf, file_header, evtx_file, checkpoint):
+    """
+    根据检查点确定增量模式需要解析的数据块和记录号区间
+    检查点记录上次处理到的记录号、该记录所在数据块的偏移和首条记录号以及文件大小。文件变小、全部记录号都不超过检查点，
+    或检查点所在数据块的首条记录号变小时，说明日志被清除、截断或换成了另一个文件，从头处理全部记录
+    只有块头末条记录号超过检查点的数据块和正在写入的数据块才会读取记录头；循环覆盖的日志中新记录可能写回前面的数据块，
+    因此数据块按首条记录号排序，保持记录顺序
+    返回 (数据块序号列表, 记录号区间, 新检查点)
+    """
+    chunk_count = get_chunk_count(buf, file_header)
+    headers = {}
+    for i in range(chunk_count):
+        chunk_offset = file_header.header_chunk_size() + i * CHUNK_SIZE
+        if buf[chunk_offset:chunk_offset + 8] == CHUNK_MAGIC:
+            headers[i] = unpack_from('<QQ', buf, chunk_offset + 0x18)
+    
+    last_record = 0
+    if checkpoint is not None:
+        last_record = checkpoint['last_record']
+        chunk_offset = checkpoint.get('chunk_offset', 0)
+        chunk_header = headers.get((chunk_offset - file_header.header_chunk_size()) // CHUNK_SIZE)
+        reason = None
+        if len(buf) < checkpoint.get('file_size', 0):
+            reason = "文件变小"
+        elif 'chunk_offset' in checkpoint and (chunk_header is None or chunk_header[0] < checkpoint.get('chunk_first_record', 0)):
+            reason = "检查点所在数据块已被替换"
+        if reason:
+            logger.warning(f"{evtx_file}: {reason}，日志可能已被清除或轮转，从头处理全部记录")
+            last_record = 0
+    
+    # 正在写入的数据块是首条记录号最大的数据块，其块头中的末条记录号可能还没有更新
+    current = max(headers, key=lambda i: headers[i][0]) if headers else None
+    newest = 0
+    ranges = {}
+    for i, (first, last) in headers.items():
+        newest = max(newest, last)
+        if last > last_record or i == current:
+            record_range = read_chunk_record_range(buf, file_header.header_chunk_size() + i * CHUNK_SIZE)
+            if record_range is not None:
+                newest = max(newest, record_range[1])
+                if record_range[1] > last_record:
+                    ranges[i] = record_range
+    
+    if newest < last_record:
+        logger.warning(f"{evtx_file}: 记录号小于检查点，日志可能已被清除或轮转，从头处理全部记录")
+        return plan_incremental(buf, file_header, evtx_file, None)
+    
+    chunk_indexes = sorted(ranges, key=lambda i: ranges[i][0])
+    if not chunk_indexes:
+        new_checkpoint = dict(checkpoint or {'last_record': 0}, last_record=last_record, file_size=len(buf))
+        return [], (last_record, last_record), new_checkpoint
+    
+    oldest = ranges[chunk_indexes[0]][0]
+    if last_record and oldest > last_record + 1:
+        logger.warning(f"{evtx_file}: 记录 {last_record + 1}-{oldest - 1} 在读取前已被循环覆盖")
+    
+    newest_index = chunk_indexes[-1]
+    new_checkpoint = {
+        'last_record': ranges[newest_index][1],
+        'chunk_offset': file_header.header_chunk_size() + newest_index * CHUNK_SIZE,
+        'chunk_first_record': headers[newest_index][0],
+        'file_size': len(buf),
+    }
+    return chunk_indexes, (last_record, new_checkpoint['last_record']), new_checkpoint
+
+def process_chunk(task):
+    """
+    在工作进程中处理一组数据块，筛选条件为 init_worker 传入的 worker_filter
+    task 为 (EVTX文件路径, 数据块序号列表, 是否收集缓存事件, 记录号区间)
+    工作进程自行映射文件（见 open_worker_evtx），只有筛选后的结果（以及需要写入缓存的事件）会传回主进程
+    返回 (EVTX文件路径, (结果列表, 事件ID计数, 处理记录数, 符合事件ID筛选的记录数, 缓存事件列表), 错误信息)，
+    出错时返回出错之前的结果，没有出错时错误信息为 None
+    """
+    evtx_file, chunk_indexes, collect_events, record_range = task
+    results = []
+    event_id_counts = {}
+    event_count = 0
+    filtered_count = 0
+    events = [] if collect_events else None
+    
+    try:
+        with open_worker_evtx(evtx_file) as (buf, file_header):
+            for chunk in iter_chunks(buf, file_header, chunk_indexes):
+                chunk_results, chunk_counts, chunk_events, chunk_filtered = process_records(buf, chunk, worker_filter, events, record_range)
+                results.extend(chunk_results)
+                merge_counts(event_id_counts, chunk_counts)
+                event_count += chunk_events
+                filtered_count += chunk_filtered
+                
+        return evtx_file, (results, event_id_counts, event_count, filtered_count, events), None
+        
+    except Exception as e:
+        error = f"处理数据块 {chunk_indexes[0]}-{chunk_indexes[-1]} 时出错: {str(e)}"
+        logger.error(f"{evtx_file}: {error}", exc_info=True)
+        return evtx_file, (results, event_id_counts, event_count, filtered_count, events), error
+
+def expand_evtx_paths(paths):
+    """
+    将文件、目录和通配符展开为EVTX文件列表
+    目录递归查找 .evtx 文件；结果去重并保持给出的顺序，没有找到任何文件时抛出 FileNotFoundError
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = []
+            for root, dirs, names in os.walk(path):
+                found.extend(os.path.join(root, name) for name in names if name.lower().endswith('.evtx'))
+            files.extend(sorted(found))
+        elif not os.path.exists(path) and any(c in path for c in '*?['):
+            files.extend(sorted(name for name in glob.glob(path, recursive=True) if os.path.isfile(name)))
+        else:
+            files.append(path)
+    
+    unique = []
+    seen = set()
+    for path in files:
+        key = os.path.normcase(os.path.abspath(path))
+        if key not in seen:
+            seen.add(key)
+            unique.append(path)
+    
+    if not unique:
+        raise FileNotFoundError(f"未找到EVTX文件: {' '.join(paths)}")
+    return unique
+
+def plan_evtx_file(evtx_file, event_filter, use_cache, checkpoint_key=None):
+    """
+    确定单个EVTX文件的处理方式：命中缓存时直接读取缓存，否则确定需要解析的数据块
+    checkpoint_key 不为 None 时为增量模式，只解析检查点之后的新记录（见 plan_incremental），不读写事件缓存
+    返回计划字典，包括 evtx_file、total_records、cache_path、cached、chunk_indexes、cache_file，
+    以及增量模式的 record_range、checkpoint_path 和 checkpoint；处理过程中出错时 error 为错误信息
+    """
+    plan = {
+        'evtx_file': evtx_file,
+        'total_records': 0,
+        'cache_path': None,
+        'cached': False,
+        'chunk_indexes': [],
+        'cache_file': None,
+        'record_range': None,
+        'checkpoint_path': None,
+        'checkpoint': None,
+        'error': None,
+    }
+    
+    with open_evtx(evtx_file) as (buf, file_header):
+        if checkpoint_key is not None:
+            plan['checkpoint_path'] = get_checkpoint_path(evtx_file, checkpoint_key)
+            plan['chunk_indexes'], plan['record_range'], plan['checkpoint'] = plan_incremental(
+                buf, file_header, evtx_file, load_checkpoint(plan['checkpoint_path']))
+            first, last = plan['record_range']
+            plan['total_records'] = last - first
+            if last > first:
+                logger.info(f"{evtx_file}: 增量处理记录 {first + 1}-{last}，共 {len(plan['chunk_indexes'])} 个数据块")
+            else:
+                logger.info(f"{evtx_file}: 没有新记录")
+            return plan
+        
+        # 根据文件头和块头估算总记录数，不再为进度条预先遍历全部记录
+        plan['total_records'] = estimate_total_records(file_header)
+        
+        if use_cache:
+            if set(event_filter.extra_fields) <= EVENT_DATA_FIELDS:
+                plan['cache_path'] = get_event_cache_path(evtx_file)
+            else:
+                logger.info("请求的字段不在事件缓存中，本次不使用缓存")
+        
+        chunk_count = get_chunk_count(buf, file_header)
+        if plan['cache_path'] and os.path.exists(plan['cache_path']):
+            # 命中缓存时直接筛选缓存中的事件，不再解析EVTX文件
+            logger.info(f"使用事件缓存: {plan['cache_path']}")
+            os.utime(plan['cache_path'])
+            plan['cached'] = True
+        elif plan['cache_path']:
+            # 写入缓存需要解析全部数据块
+            plan['chunk_indexes'] = list(range(chunk_count))
+        else:
+            # 指定时间范围时借助数据块时间索引跳过整块不在范围内的数据块
+            plan['chunk_indexes'] = select_chunks(buf, file_header, evtx_file, chunk_count, event_filter)
+            if len(plan['chunk_indexes']) < chunk_count:
+                logger.info(f"{evtx_file}: 按时间范围跳过 {chunk_count - len(plan['chunk_indexes'])}/{chunk_count} 个数据块")
+                plan['total_records'] = estimate_total_records(file_header, iter_chunks(buf, file_header, plan['chunk_indexes']))
+                logger.info(f"需要解析的记录数: {plan['total_records']}")
+    
+    return plan
+
+def read_cached_batches(plan, event_filter):
+    """
+    逐批筛选文件的事件缓存，返回值格式与 process_records 加上缓存事件列表(None)相同
+    缓存无法读取时记录到 plan['error']，不影响其他文件
+    """
+    try:
+        for record_count, events in iter_event_cache(plan['cache_path']):
+            yield process_cached_events(record_count, events, event_filter) + (None,)
+    except Exception as e:
+        plan['error'] = f"读取事件缓存失败: {str(e)}"
+        logger.error(f"{plan['evtx_file']}: {plan['error']}")
+
+def split_tasks(plan):
+    """
+    将文件需要解析的数据块按 CHUNKS_PER_TASK 分组为进程池任务，任务中不包含筛选条件和记录数据
+    """
+    collect_events = plan['cache_path'] is not None and not plan['cached']
+    chunk_indexes = plan['chunk_indexes']
+    return [
+        (plan['evtx_file'], chunk_indexes[first:first + CHUNKS_PER_TASK], collect_events, plan['record_range'])
+        for first in range(0, len(chunk_indexes), CHUNKS_PER_TASK)
+    ]
+
+def run_parallel(plans, event_filter, workers, preserve_order):
+    """
+    将所有文件的数据块任务交给同一个进程池，逐个返回 (计划, 处理结果)
+    命中缓存的文件在主进程中读取；preserve_order 为真时按文件和数据块的原始顺序返回
+    任务出错时错误信息记录到对应计划的 error 中，其余任务照常处理
+    """
+    units = []
+    for plan in plans:
+        if plan['cached']:
+            units.append((plan, None))
+        else:
+            units.extend((plan, task) for task in split_tasks(plan))
+    tasks = [task for plan, task in units if task is not None]
+    
+    # 筛选条件（可能包含很大的监视列表）只在创建工作进程时传递一次
+    with Pool(workers, init_worker, (event_filter,)) as pool:
+        if preserve_order:
+            task_results = pool.imap(process_chunk, tasks)
+            for plan, task in units:
+                if task is None:
+                    for batch in read_cached_batches(plan, event_filter):
+                        yield plan, batch
+                else:
+                    evtx_file, batch, error = next(task_results)
+                    if error is not None and plan['error'] is None:
+                        plan['error'] = error
+                    yield plan, batch
+        else:
+            task_results = pool.imap_unordered(process_chunk, tasks)
+            for plan in plans:
+                if plan['cached']:
+                    for batch in read_cached_batches(plan, event_filter):
+                        yield plan, batch
+            plans_by_file = {plan['evtx_file']: plan for plan in plans}
+            for evtx_file, batch, error in task_results:
+                plan = plans_by_file[evtx_file]
+                if error is not None and plan['error'] is None:
+                    plan['error'] = error
+                yield plan, batch
+
+def read_ahead(plans, chunk_queue, stop):
+    """
+    读取线程：按处理顺序读取各文件需要解析的数据块，放入有界队列 chunk_queue
+    读文件时不占用GIL，解析和读取可以同时进行；队列满时等待解析线程取走，内存中最多保留 READ_AHEAD_BLOCKS 项
+    序号连续的数据块一次读入（最多 READ_BLOCK_CHUNKS 个），减少网络存储的请求次数和线程切换
+    每项为 (读入的数据, 数据块数)；读取某个文件出错（包括没有读满数据块）时放入异常对象，然后继续读取下一个文件；
+    stop 被设置时提前结束
+    """
+    def put(item):
+        while not stop.is_set():
+            try:
+                chunk_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    for plan in plans:
+        if plan['cached'] or not plan['chunk_indexes']:
+            continue
+        try:
+            with open(plan['evtx_file'], 'rb', buffering=0) as f:
+                header_chunk_size = evtx.FileHeader(f.read(0x80), 0x0).header_chunk_size()
+                chunk_indexes = plan['chunk_indexes']
+                first = 0
+                while first < len(chunk_indexes):
+                    count = 1
+                    while (count < READ_BLOCK_CHUNKS and first + count < len(chunk_indexes)
+                           and chunk_indexes[first + count] == chunk_indexes[first] + count):
+                        count += 1
+                    # 末尾留出补零的8字节：数据块写满时解析库会读取下一条记录头的标识和长度
+                    data = bytearray(count * CHUNK_SIZE + 8)
+                    view = memoryview(data)[:count * CHUNK_SIZE]
+                    f.seek(header_chunk_size + chunk_indexes[first] * CHUNK_SIZE)
+                    # 网络存储上的文件一次可能读不满
+                    while view:
+                        size = f.readinto(view)
+                        if not size:
+                            raise OSError("文件在读取过程中被截断")
+                        view = view[size:]
+                    if not put((data, count)):
+                        return
+                    first += count
+        except Exception as e:
+            if not put(e):
+                return
+
+def run_serial(plans, event_filter, prefetch=True):
+    """
+    在当前进程中逐个文件、逐块处理，返回值格式与 run_parallel 相同
+    prefetch 为真时数据块由读取线程预先读入内存（见 read_ahead），读取网络存储上的文件时I/O等待与解析重叠；
+    否则直接在内存映射上逐块解析，不启动线程也不占用预读缓冲
+    读取或解析出错时错误信息记录到对应计划的 error 中，继续处理其余数据块和文件
+    """
+    if not prefetch:
+        yield from run_serial_mapped(plans, event_filter)
+        return
+    
+    chunk_queue = queue.Queue(READ_AHEAD_BLOCKS)
+    stop = threading.Event()
+    reader = threading.Thread(target=read_ahead, args=(plans, chunk_queue, stop), daemon=True)
+    reader.start()
+    try:
+        for plan in plans:
+            if plan['cached']:
+                for batch in read_cached_batches(plan, event_filter):
+                    yield plan, batch
+                continue
+        
+            collect_events = plan['cache_path'] is not None
+            remaining = len(plan['chunk_indexes'])
+            while remaining:
+                item = chunk_queue.get()
+                if isinstance(item, Exception):
+                    # 读取线程已经转到下一个文件
+                    plan['error'] = f"读取文件出错: {str(item)}"
+                    logger.error(f"{plan['evtx_file']}: {plan['error']}")
+                    break
+                data, count = item
+                remaining -= count
+                # 数据块内的偏移都相对于块头，直接在读入的数据上解析
+                for i in range(count):
+                    try:
+                        chunk = evtx.ChunkHeader(data, i * CHUNK_SIZE)
+                        if not chunk.check_magic():
+                            continue
+                        events = [] if collect_events else None
+                        batch = process_records(data, chunk, event_filter, events, plan['record_range']) + (events,)
+                    except Exception as e:
+                        if plan['error'] is None:
+                            plan['error'] = f"处理数据块时出错: {str(e)}"
+                        logger.error(f"{plan['evtx_file']}: 处理数据块时出错: {str(e)}")
+                        continue
+                    yield plan, batch
+    finally:
+        # 提前停止时通知读取线程结束
+        stop.set()
+        reader.join()
+
+def run_serial_mapped(plans, event_filter):
+    """
+    不预读的 run_serial：逐个文件映射后逐块解析
+    """
+    for plan in plans:
+        if plan['cached']:
+            for batch in read_cached_batches(plan, event_filter):
+                yield plan, batch
+            continue
+        
+        collect_events = plan['cache_path'] is not None
+        try:
+            with open_evtx(plan['evtx_file']) as (buf, file_header):
+                for chunk in iter_chunks(buf, file_header, plan['chunk_indexes']):
+                    try:
+                        events = [] if collect_events else None
+                        batch = process_records(buf, chunk, event_filter, events, plan['record_range']) + (events,)
+                    except Exception as e:
+                        if plan['error'] is None:
+                            plan['error'] = f"处理数据块时出错: {str(e)}"
+                        logger.error(f"{plan['evtx_file']}: 处理数据块时出错: {str(e)}")
+                        continue
+                    yield plan, batch
+        except OSError as e:
+            plan['error'] = f"读取文件出错: {str(e)}"
+            logger.error(f"{plan['evtx_file']}: {plan['error']}")
+
+def merge_counts(target, counts):
+    """
+    将事件ID计数合并到目标字典
+    """
+    for event_id, count in counts.items():
+        target[event_id] = target.get(event_id, 0) + count
+
+class JsonArrayWriter:
+    """
+    以JSON数组格式逐条写入分析结果，输出与 json.dump(results, indent=2) 相同
+    append 为真时接在已有数组的末尾继续写入，结果与一次写入全部事件相同
+    rollback 丢弃上次 mark 之后写入的事件，用于增量模式中断时去掉还没有保存检查点的结果
+    """
+    def __init__(self, output_file, append=False):
+        self.count = 0
+        if append and os.path.exists(output_file) and os.path.getsize(output_file) > 0:
+            self.count = self.strip_array_end(output_file)
+            self.file = open(output_file, 'a', encoding='utf-8', buffering=OUTPUT_BUFFER_SIZE)
+        else:
+            self.file = open(output_file, 'w', encoding='utf-8', buffering=OUTPUT_BUFFER_SIZE)
+        self.mark()
+    
+    @staticmethod
+    def strip_array_end(output_file):
+        """
+        去掉已有JSON数组文件结尾的 ']'，返回文件中已有的事件是否非空（1 或 0）
+        上次写入被中断（如跟踪模式被终止）时文件没有结尾的 ']'，此时截断到最后一个完整的事件之后
+        """
+        with open(output_file, 'rb+') as f:
+            size = f.seek(0, os.SEEK_END)
+            f.seek(max(size - 64, 0))
+            tail = f.read()
+            stripped = tail.rstrip()
+            if stripped.endswith(b']'):
+                body = stripped[:-1].rstrip()
+                end = size - len(tail) + len(body)
+                if body.endswith(b'[') and end == 1:
+                    f.truncate(0)
+                    return 0
+                f.truncate(end)
+                return 1
+            
+            f.seek(0)
+            if f.read(1) != b'[':
+                raise ValueError(f"{output_file} 不是JSON数组，无法追加写入")
+            # 每个事件对象以单独一行缩进两格的 '}' 结束，嵌套对象的缩进更深，字符串中的换行已转义
+            marker = b'\n  }'
+            position = size
+            end = None
+            while position > 0 and end is None:
+                start = max(position - OUTPUT_BUFFER_SIZE, 0)
+                f.seek(start)
+                block = f.read(position - start + len(marker) - 1)
+                index = block.rfind(marker)
+                if index >= 0:
+                    end = start + index + len(marker)
+                position = start
+            logger.warning(f"{output_file} 没有结尾的 ']'，上次写入可能被中断，从最后一个完整的事件之后继续写入")
+            if end is None:
+                f.truncate(0)
+                return 0
+            f.truncate(end)
+            return 1
+    
+    def write(self, event):
+        text = json.dumps(event.to_dict(), ensure_ascii=False, indent=2, default=str).replace('\n', '\n  ')
+        self.file.write(('[\n  ' if self.count == 0 else ',\n  ') + text)
+        self.count += 1
+    
+    def flush(self):
+        self.file.flush()
+    
+    def mark(self):
+        self.file.flush()
+        self.marked = (self.file.tell(), self.count)
+    
+    def rollback(self):
+        position, self.count = self.marked
+        self.file.seek(position)
+        self.file.truncate()
+    
+    def close(self):
+        self.file.write('\n]' if self.count else '[]')
+        self.file.close()
+
+class NdjsonWriter:
+    """
+    以NDJSON格式（每行一个JSON对象）逐条写入分析结果，append 为真时追加到文件末尾
+    上次写入被中断时文件末尾可能有不完整的一行，追加前先去掉；mark 和 rollback 与 JsonArrayWriter 相同
+    """
+    def __init__(self, output_file, append=False):
+        if append and os.path.exists(output_file):
+            self.strip_partial_line(output_file)
+        self.file = open(output_file, 'a' if append else 'w', encoding='utf-8', buffering=OUTPUT_BUFFER_SIZE)
+        self.count = 0
+        self.mark()
+    
+    @staticmethod
+    def strip_partial_line(output_file):
+        """
+        截断到最后一个换行符之后
+        """
+        with open(output_file, 'rb+') as f:
+            position = size = f.seek(0, os.SEEK_END)
+            while position > 0:
+                start = max(position - OUTPUT_BUFFER_SIZE, 0)
+                f.seek(start)
+                index = f.read(position - start).rfind(b'\n')
+                if index >= 0:
+                    position = start + index + 1
+                    break
+                position = start
+            if position < size:
+                logger.warning(f"{output_file} 末尾的记录不完整，上次写入可能被中断，已去掉这一行")
+                f.truncate(position)
+    
+    def write(self, event):
+        self.file.write(json.dumps(event.to_dict(), ensure_ascii=False, default=str) + '\n')
+        self.count += 1
+    
+    def flush(self):
+        self.file.flush()
+    
+    def mark(self):
+        self.file.flush()
+        self.marked = (self.file.tell(), self.count)
+    
+    def rollback(self):
+        position, self.count = self.marked
+        self.file.seek(position)
+        self.file.truncate()
+    
+    def close(self):
+        self.file.close()
+
+class ParquetWriter:
+    """
+    以Parquet列式格式分批写入分析结果
+    时间列存为微秒精度的整数时间戳，事件ID为整数，重复值较多的文本列使用字典编码
+    extra_fields 中的额外字段按原始字段名追加为文本列，with_source 为真时追加来源文件列
+    """
+    def __init__(self, output_file, extra_fields=(), with_source=False):
+        if not PARQUET_SUPPORT:
+            raise ImportError("未安装pyarrow库，无法导出Parquet文件。请运行 'pip install pyarrow' 安装。")
+        
+        self.schema = pa.schema(
+            [('时间', pa.timestamp('us')), ('事件ID', pa.int32())] +
+            [(name, pa.dictionary(pa.int32(), pa.string())) for name in PARQUET_DICTIONARY_COLUMNS] +
+            [(name, pa.dictionary(pa.int32(), pa.string())) for name in extra_fields] +
+            ([('来源文件', pa.dictionary(pa.int32(), pa.string()))] if with_source else [])
+        )
+        self.extra_fields = tuple(extra_fields)
+        self.with_source = with_source
+        self.sources = []
+        self.writer = pq.ParquetWriter(output_file, self.schema)
+        self.rows = []
+        self.extras = []
+        self.count = 0
+    
+    def write(self, event):
+        self.rows.append(event.to_row())
+        if self.extra_fields:
+            self.extras.append(event.extra or {})
+        if self.with_source:
+            self.sources.append(event.source)
+        self.count += 1
+        if len(self.rows) >= PARQUET_BATCH_SIZE:
+            self.flush()
+    
+    def flush(self):
+        if not self.rows:
+            return
+        columns = dict(zip(RESULT_COLUMNS, zip(*self.rows)))
+        
+        # FILETIME直接换算为Unix微秒整数，不经过datetime
+        timestamps = [
+            filetime_to_unix_microseconds(value) if value is not None else None
+            for value in columns['时间']
+        ]
+        arrays = [
+            pa.array(timestamps, type=pa.timestamp('us')),
+            pa.array(columns['事件ID'], type=pa.int32()),
+        ]
+        for name in PARQUET_DICTIONARY_COLUMNS:
+            arrays.append(pa.array(columns[name], type=pa.string()).dictionary_encode())
+        for name in self.extra_fields:
+            arrays.append(pa.array([extra.get(name) for extra in self.extras], type=pa.string()).dictionary_encode())
+        if self.with_source:
+            arrays.append(pa.array(self.sources, type=pa.string()).dictionary_encode())
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+        
+        self.rows = []
+        self.extras = []
+        self.sources = []
+    
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.writer.close()
+
+class BackgroundWriter:
+    """
+    在单独的线程中写入结果，分析线程只把结果按批放入有界队列，写文件的I/O等待不再阻塞解析
+    队列满时分析线程等待写入线程，最多积压 WRITE_QUEUE_SIZE 批结果；写入出错时在之后的 write、flush 或 close 中抛出
+    """
+    def __init__(self, writer):
+        self.writer = writer
+        self.count = 0
+        self.batch = []
+        self.error = None
+        self.queue = queue.Queue(WRITE_QUEUE_SIZE)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+    
+    def run(self):
+        while True:
+            batch = self.queue.get()
+            try:
+                if batch is None:
+                    return
+                # 出错后继续取走队列中的结果，避免分析线程一直等待
+                if self.error is None:
+                    for event in batch:
+                        self.writer.write(event)
+            except Exception as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+    
+    def check_error(self):
+        if self.error is not None:
+            raise self.error
+    
+    def write(self, event):
+        self.batch.append(event)
+        self.count += 1
+        if len(self.batch) >= WRITE_BATCH_SIZE:
+            self.check_error()
+            self.queue.put(self.batch)
+            self.batch = []
+    
+    def flush(self):
+        if self.batch:
+            self.queue.put(self.batch)
+            self.batch = []
+        # 等待写入线程处理完已提交的结果后再刷新文件
+        self.queue.join()
+        self.check_error()
+        self.writer.flush()
+    
+    def mark(self):
+        """
+        写入已提交的结果并记录位置，之后 close(rollback=True) 时截断到这里
+        """
+        self.flush()
+        self.writer.mark()
+    
+    def close(self, rollback=False):
+        try:
+            if rollback:
+                self.batch = []
+            elif self.batch:
+                self.queue.put(self.batch)
+                self.batch = []
+            self.queue.put(None)
+            self.thread.join()
+            if rollback:
+                self.writer.rollback()
+        finally:
+            self.writer.close()
+        if not rollback:
+            self.check_error()
+
+def open_result_writer(output_file, output_format='json', extra_fields=(), with_source=False, append=False):
+    """
+    根据输出格式创建结果写入器，append 为真时追加到已有的输出文件（parquet 格式不支持）
+    """
+    if output_format == 'json':
+        return JsonArrayWriter(output_file, append)
+    if output_format == 'ndjson':
+        return NdjsonWriter(output_file, append)
+    if output_format == 'parquet':
+        if append:
+            raise ValueError("parquet 格式不支持追加写入，增量模式请使用 json 或 ndjson 格式")
+        return ParquetWriter(output_file, extra_fields, with_source)
+    raise ValueError(f"不支持的输出格式: {output_format}")
+
+def save_to_excel(results, output_file):
+    """
+    将分析结果保存为Excel文件
+    """
+    if not EXCEL_SUPPORT:
+        raise ImportError("未安装openpyxl库，无法导出Excel文件。请运行 'pip install openpyxl' 安装。")
+    
+    # 创建工作簿和工作表
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "事件分析结果"
+    
+    # 定义表头
+    headers = ['时间', '事件ID', '事件类型', '账户', '域', '工作站', 'IP地址', '进程名称', '登录进程']
+    
+    # 写入表头
+    for col, header in enumerate(headers, 1):
+        cell = ws.cell(row=1, column=col)
+        cell.value = header
+        cell.font = Font(bold=True)
+        cell.alignment = Alignment(horizontal='center')
+    
+    # 写入数据
+    for row, event in enumerate(results, 2):
+        for col, header in enumerate(headers, 1):
+            cell = ws.cell(row=row, column=col)
+            cell.value = str(event.get(header, ''))
+            cell.alignment = Alignment(horizontal='center')
+    
+    # 调整列宽
+    for col in ws.columns:
+        max_length = 0
+        column = col[0].column_letter
+        for cell in col:
+            try:
+                if len(str(cell.value)) > max_length:
+                    max_length = len(str(cell.value))
+            except:
+                pass
+        adjusted_width = (max_length + 2)
+        ws.column_dimensions[column].width = adjusted_width
+    
+    # 保存文件
+    wb.save(output_file)
+
+def estimate_total_records(file_header, chunks=None):
+    """
+    根据EVTX文件头和各数据块头中的首末记录号估算记录总数
+    只读取每个64KB数据块的头部，不解析任何记录；chunks 为 None 时统计全部数据块
+    """
+    total = 0
+    try:
+        for chunk in (file_header.chunks() if chunks is None else chunks):
+            if not chunk.check_magic():
+                continue
+            first = chunk.log_first_record_number()
+            last = chunk.log_last_record_number()
+            if last >= first:
+                total += last - first + 1
+    except Exception as e:
+        logger.warning(f"读取数据块头时出错: {str(e)}")
+    
+    if total == 0 and chunks is None:
+        # 块头不可用时退回到文件头中的下一条记录号
+        total = max(file_header.next_record_number() - 1, 0)
+    return total
+
+def iter_events(evtx_files, event_filter=None, workers=1, preserve_order=True, use_cache=False, progress_callback=None, summary=None,
+                checkpoint_key=None, prefetch=True):
+    """
+    逐条返回EVTX文件中匹配 event_filter 的事件（EventRecord），边解析边产出，调用方可以随时停止遍历
+    evtx_files 为单个路径或文件、目录和通配符的列表，所有文件的数据块共用一个进程池解析，单个文件出错不影响其他文件
+    summary 为字典时更新其中的记录数、匹配数和各事件ID计数，files 中为各文件的统计及出错信息
+    checkpoint_key 不为 None 时为增量模式，只处理新增的记录；检查点放在 summary['checkpoints'] 中，由调用方写入结果后保存
+    """
+    if event_filter is None:
+        event_filter = EventFilter()
+    if summary is None:
+        summary = {}
+    evtx_files = expand_evtx_paths(evtx_files)
+    tag_source = len(evtx_files) > 1
+    
+    # 一批文件中个别文件损坏或无法打开（如空文件）时跳过该文件，继续分析其他文件
+    plans = []
+    summary.update(total_records=0, total_events=0, filtered_events=0, matched_events=0, event_id_counts={}, files={},
+                   checkpoints=[])
+    for evtx_file in evtx_files:
+        file_summary = summary['files'][evtx_file] = {
+            'total_records': 0, 'total_events': 0, 'filtered_events': 0, 'matched_events': 0, 'event_id_counts': {},
+        }
+        try:
+            plan = plan_evtx_file(evtx_file, event_filter, use_cache, checkpoint_key)
+        except Exception as e:
+            file_summary['error'] = f"无法打开文件: {str(e)}"
+            logger.error(f"{evtx_file}: {file_summary['error']}，已跳过")
+            continue
+        plan['source'] = sys.intern(evtx_file)
+        file_summary['total_records'] = plan['total_records']
+        plans.append(plan)
+    total_records = summary['total_records'] = sum(plan['total_records'] for plan in plans)
+    if progress_callback:
+        progress_callback(10, f"预计总记录数: {total_records}")
+        
+    # 写入缓存时需要按顺序写入每个文件的全部记录
+    collecting = any(plan['cache_path'] is not None and not plan['cached'] for plan in plans)
+    task_count = sum(len(split_tasks(plan)) for plan in plans)
+    workers = min(workers or cpu_count(), task_count)
+    
+    def finish_plan(plan):
+        # 文件处理完后提交事件缓存，出错的文件缓存不完整，直接丢弃
+        if plan['error'] is not None:
+            summary['files'][plan['evtx_file']]['error'] = plan['error']
+        if plan['cache_file'] is not None:
+            if plan['error'] is None:
+                commit_event_cache(plan['cache_file'], plan['cache_path'])
+            else:
+                discard_event_cache(plan['cache_file'])
+            plan['cache_file'] = None
+    
+    if workers > 1:
+        logger.info(f"使用 {workers} 个进程并行分析 {len(plans)} 个文件的 {sum(len(plan['chunk_indexes']) for plan in plans)} 个数据块")
+        batches = run_parallel(plans, event_filter, workers, preserve_order or collecting)
+    else:
+        batches = run_serial(plans, event_filter, prefetch)
+        
+    current_plan = None
+    last_report = 0
+    try:
+        for plan, (chunk_results, chunk_counts, chunk_events, chunk_filtered, events) in batches:
+            if plan is not current_plan:
+                # 按顺序写入缓存时，切换到下一个文件说明上一个文件已处理完
+                if current_plan is not None:
+                    finish_plan(current_plan)
+                current_plan = plan
+            
+            if events is not None:
+                if plan['cache_file'] is None:
+                    plan['cache_file'] = open_event_cache(plan['cache_path'])
+                    if plan['cache_file'] is None:
+                        plan['cache_path'] = None
+                if plan['cache_file'] is not None:
+                    pickle.dump((chunk_events, events), plan['cache_file'], pickle.HIGHEST_PROTOCOL)
+        
+            file_summary = summary['files'][plan['evtx_file']]
+            for target in (summary, file_summary):
+                merge_counts(target['event_id_counts'], chunk_counts)
+                target['total_events'] += chunk_events
+                target['filtered_events'] += chunk_filtered
+                target['matched_events'] += len(chunk_results)
+                
+            for event in chunk_results:
+                if tag_source:
+                    event.source = plan['source']
+                yield event
+                
+            # 更新进度。估算值可能偏小（如日志仍在写入），进度最多到90%
+            processed_count = summary['total_events']
+            if progress_callback and processed_count - last_report >= 1000:
+                last_report = processed_count
+                progress = 10 + int(min(processed_count / max(total_records, 1), 1.0) * 80)
+                progress_callback(progress, f"已处理 {processed_count}/{total_records} 条记录")
+    except BaseException:
+        # 包括调用方提前停止遍历（GeneratorExit），此时缓存不完整
+        for plan in plans:
+            if plan['cache_file'] is not None:
+                discard_event_cache(plan['cache_file'])
+                plan['cache_file'] = None
+        raise
+    finally:
+        # 提前停止时关闭进程池
+        batches.close()
+        
+    for plan in plans:
+        finish_plan(plan)
+        if plan['checkpoint_path'] is not None and plan['error'] is None:
+            summary['checkpoints'].append((plan['checkpoint_path'], plan['checkpoint']))
+
+def reorder_events(events, window=REORDER_BUFFER_SIZE):
+    """
+    用大小为 window 的小顶堆对近似按时间排序的事件流做有界重排
+    文件内乱序距离不超过 window 条的事件会被排回正确位置，内存中最多保留 window 条事件
+    """
+    heap = []
+    for seq, event in enumerate(events):
+        # 序号保证时间相同的事件保持原有顺序，也避免比较 EventRecord
+        item = (event.timestamp, seq, event)
+        if len(heap) < window:
+            heapq.heappush(heap, item)
+        else:
+            yield heapq.heappushpop(heap, item)[2]
+    while heap:
+        yield heapq.heappop(heap)[2]
+
+def iter_timeline(evtx_files, event_filter=None, use_cache=False, progress_callback=None, summary=None, reorder_window=REORDER_BUFFER_SIZE,
+                  checkpoint_key=None):
+    """
+    按时间顺序逐条返回多个EVTX文件中匹配的事件，用于生成跨主机、跨归档的统一时间线
+    每个文件单独流式解析并经过 reorder_events 有界重排，再用堆做k路归并，不需要把全部结果读入内存
+    各文件在当前进程中逐块解析；乱序距离超过 reorder_window 的事件仍会输出，并计入 summary['out_of_order_events']
+    各文件同时处于打开状态，不使用预读线程，避免线程数和预读缓冲随文件数增长
+    summary 和 checkpoint_key 的含义与 iter_events 相同
+    """
+    if event_filter is None:
+        event_filter = EventFilter()
+    if summary is None:
+        summary = {}
+    evtx_files = expand_evtx_paths(evtx_files)
+    tag_source = len(evtx_files) > 1
+    
+    file_summaries = {evtx_file: {} for evtx_file in evtx_files}
+    streams = [
+        iter_events(evtx_file, event_filter, use_cache=use_cache, summary=file_summaries[evtx_file], checkpoint_key=checkpoint_key,
+                    prefetch=False)
+        for evtx_file in evtx_files
+    ]
+    
+    def update_summary():
+        summary.update(total_records=0, total_events=0, filtered_events=0, matched_events=0, event_id_counts={}, files={},
+                       checkpoints=[])
+        for evtx_file, file_summary in file_summaries.items():
+            if not file_summary:
+                continue
+            for key in ('total_records', 'total_events', 'filtered_events', 'matched_events'):
+                summary[key] += file_summary[key]
+            merge_counts(summary['event_id_counts'], file_summary['event_id_counts'])
+            summary['checkpoints'].extend(file_summary.get('checkpoints', []))
+            summary['files'][evtx_file] = {key: value for key, value in file_summary.items() if key not in ('files', 'checkpoints')}
+            for entry in file_summary['files'].values():
+                if 'error' in entry:
+                    summary['files'][evtx_file]['error'] = entry['error']
+    
+    def tag_events(events, source):
+        for event in events:
+            event.source = source
+            yield event
+    
+    sorted_streams = []
+    for evtx_file, stream in zip(evtx_files, streams):
+        if tag_source:
+            stream = tag_events(stream, sys.intern(evtx_file))
+        sorted_streams.append(reorder_events(stream, reorder_window))
+    
+    summary['out_of_order_events'] = 0
+    last_timestamp = None
+    last_report = 0
+    try:
+        for count, event in enumerate(heapq.merge(*sorted_streams, key=lambda event: event.timestamp), 1):
+            if last_timestamp is not None and event.timestamp < last_timestamp:
+                summary['out_of_order_events'] += 1
+            else:
+                last_timestamp = event.timestamp
+            yield event
+            
+            if progress_callback and count - last_report >= 1000:
+                last_report = count
+                update_summary()
+                processed_count = summary['total_events']
+                total_records = summary['total_records']
+                progress = 10 + int(min(processed_count / max(total_records, 1), 1.0) * 80)
+                progress_callback(progress, f"已处理 {processed_count}/{total_records} 条记录")
+    finally:
+        # 提前停止时关闭各文件的解析，未写完的事件缓存会被丢弃
+        for stream in streams:
+            stream.close()
+        update_summary()
+
+class SpillBuffer:
+    """
+    在内存预算内保存匹配的事件，超出预算时把内存中的事件按时间排序后写入磁盘临时文件（有序归并段）
+    遍历时对各归并段和内存中的事件做k路归并，按时间顺序返回全部事件，时间相同的事件保持加入顺序
+    内存中最多保留预算内的事件和每个归并段的一批读缓冲；同一时间只能有一个遍历
+    """
+    __slots__ = ('memory_budget', 'spill_dir', 'events', 'memory_size', 'runs', 'count')
+    
+    def __init__(self, memory_budget=DEFAULT_MEMORY_BUDGET, spill_dir=None):
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.events = []
+        self.memory_size = 0
+        self.runs = []
+        self.count = 0
+    
+    def __len__(self):
+        return self.count
+    
+    def append(self, event):
+        self.events.append(event)
+        self.count += 1
+        # 按每条事件的估算大小累计内存占用，额外字段另外计算
+        self.memory_size += SPILL_EVENT_SIZE + (len(event.extra) * SPILL_FIELD_SIZE if event.extra else 0)
+        if self.memory_size > self.memory_budget:
+            self.spill()
+    
+    def spill(self):
+        """
+        将内存中的事件排序后分批写入新的临时归并段
+        """
+        self.events.sort(key=event_timestamp)
+        run = tempfile.TemporaryFile(dir=self.spill_dir)
+        for first in range(0, len(self.events), SPILL_BATCH_SIZE):
+            pickle.dump(self.events[first:first + SPILL_BATCH_SIZE], run, pickle.HIGHEST_PROTOCOL)
+        self.runs.append(run)
+        self.events = []
+        self.memory_size = 0
+        logger.info(f"匹配的事件超过内存预算，已写入第 {len(self.runs)} 个临时归并段（共 {self.count} 条）")
+    
+    def __iter__(self):
+        self.events.sort(key=event_timestamp)
+        return heapq.merge(*[iter_spill_run(run) for run in self.runs], self.events, key=event_timestamp)
+    
+    def close(self):
+        """
+        删除临时归并段
+        """
+        for run in self.runs:
+            run.close()
+        self.runs = []
+        self.events = []
+
+def event_timestamp(event):
+    """
+    事件的排序键
+    """
+    return event.timestamp
+
+def iter_spill_run(run):
+    """
+    从头逐批读取临时归并段中的事件
+    """
+    run.seek(0)
+    while True:
+        try:
+            batch = pickle.load(run)
+        except EOFError:
+            return
+        yield from batch
+
+def sort_events(events, memory_budget=DEFAULT_MEMORY_BUDGET, spill_dir=None):
+    """
+    按时间对事件流做外部排序：超出内存预算的部分写入临时归并段，全部读入后再归并输出
+    """
+    buffer = SpillBuffer(memory_budget, spill_dir)
+    try:
+        for event in events:
+            buffer.append(event)
+        yield from buffer
+    finally:
+        buffer.close()
+
+class EventAggregator:
+    """
+    流式聚合匹配的事件：按字段分组计数、分组内某字段的不同取值数，以及按时间段统计的直方图
+    只保留分组计数、不同取值集合和直方图，不保留逐条事件；Top-N 用大小为 N 的堆选出
+    group_by 和 distinct_field 使用 AGGREGATE_FIELDS 中的字段名，其余字段名从事件的额外字段中读取
+    """
+    __slots__ = ('group_by', 'getters', 'distinct_field', 'distinct_getter', 'bucket_size',
+                 'counts', 'distinct_values', 'histogram', 'total')
+    
+    def __init__(self, group_by=None, distinct_field=None, histogram_interval=None):
+        self.group_by = tuple(group_by) if group_by else ()
+        self.getters = [make_field_getter(name) for name in self.group_by]
+        self.distinct_field = distinct_field
+        self.distinct_getter = make_field_getter(distinct_field) if distinct_field else None
+        # 直方图时间段长度（秒）换算为FILETIME单位
+        self.bucket_size = int(histogram_interval * 10000000) if histogram_interval else None
+        self.counts = {}
+        self.distinct_values = {}
+        self.histogram = {}
+        self.total = 0
+    
+    def add(self, event):
+        self.total += 1
+        key = tuple(getter(event) for getter in self.getters)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        if self.distinct_getter is not None:
+            value = self.distinct_getter(event)
+            if value is not None:
+                values = self.distinct_values.get(key)
+                if values is None:
+                    values = self.distinct_values[key] = set()
+                values.add(value)
+        if self.bucket_size is not None:
+            bucket = event.timestamp // self.bucket_size
+            self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+    
+    def get_state(self):
+        """
+        返回可以保存为JSON的统计状态，增量模式下用 set_state 在下次运行时恢复
+        """
+        return {
+            'counts': [[list(key), count] for key, count in self.counts.items()],
+            'distinct_values': [[list(key), list(values)] for key, values in self.distinct_values.items()],
+            'histogram': [[bucket, count] for bucket, count in self.histogram.items()],
+            'total': self.total,
+        }
+    
+    def set_state(self, state):
+        self.counts = {tuple(key): count for key, count in state['counts']}
+        self.distinct_values = {tuple(key): set(values) for key, values in state['distinct_values']}
+        self.histogram = {bucket: count for bucket, count in state['histogram']}
+        self.total = state['total']
+    
+    def group_table(self, top=None):
+        """
+        返回分组统计表，按数量从多到少排列；top 指定时只保留数量最多的前 top 组
+        """
+        if top:
+            groups = heapq.nlargest(top, self.counts.items(), key=lambda item: item[1])
+        else:
+            groups = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+        
+        table = []
+        for key, count in groups:
+            row = dict(zip(self.group_by, key))
+            row['数量'] = count
+            if self.distinct_field:
+                row[f'不同{self.distinct_field}数'] = len(self.distinct_values.get(key, ()))
+            table.append(row)
+        return table
+    
+    def histogram_table(self):
+        """
+        返回按时间段排列的直方图
+        """
+        return [
+            {'时间段': filetime_to_datetime(bucket * self.bucket_size).strftime('%Y-%m-%d %H:%M:%S'), '数量': count}
+            for bucket, count in sorted(self.histogram.items())
+        ]
+    
+    def tables(self, top=None):
+        """
+        返回全部统计表：总数、分组统计和（指定时间段长度时的）直方图
+        """
+        tables = {'总数': self.total, '分组统计': self.group_table(top)}
+        if self.bucket_size is not None:
+            tables['时间分布'] = self.histogram_table()
+        return tables
+
+def make_field_getter(name):
+    """
+    返回从 EventRecord 中读取指定字段的函数
+    """
+    attribute = AGGREGATE_FIELDS.get(name)
+    if attribute is not None:
+        return lambda event: getattr(event, attribute)
+    return lambda event: event.extra.get(name) if event.extra else None
+
+def aggregate_events(events, group_by=None, distinct_field=None, histogram_interval=None, top=None):
+    """
+    流式聚合事件流（如 iter_events 的返回值），返回统计表（见 EventAggregator.tables）
+    """
+    aggregator = EventAggregator(group_by, distinct_field, histogram_interval)
+    for event in events:
+        aggregator.add(event)
+    return aggregator.tables(top)
+
+def print_aggregate_tables(tables):
+    """
+    打印聚合统计表
+    """
+    print(f"\n聚合统计（共 {tables['总数']} 条事件）:")
+    for row in tables['分组统计']:
+        fields = [f"{name}={'未知' if value is None else value}" for name, value in row.items()
+                  if name != '数量' and not name.startswith('不同')]
+        line = f"{', '.join(fields) or '全部'}: {row['数量']} 条"
+        distinct = [f"{name} {value}" for name, value in row.items() if name.startswith('不同')]
+        if distinct:
+            line += f"（{distinct[0]}）"
+        print(line)
+    
+    if '时间分布' in tables:
+        print("\n时间分布:")
+        for row in tables['时间分布']:
+            print(f"{row['时间段']}: {row['数量']} 条")
+
+class BruteForceDetector:
+    """
+    滑动窗口暴力破解和密码喷洒检测，事件需要大致按时间顺序输入
+    同一 (来源, 账户) 在窗口内的登录失败次数达到 threshold 时报告暴力破解；
+    同一来源在窗口内尝试的不同账户数达到 spray_threshold 时报告密码喷洒
+    计数保存在带过期的双端队列中，空闲超过窗口的键会被清理：内存只与活跃的键数量有关，每条事件的开销为均摊 O(1)
+    """
+    __slots__ = ('window', 'threshold', 'spray_threshold', 'pair_attempts', 'source_attempts',
+                 'source_accounts', 'last_seen', 'alerts')
+    
+    def __init__(self, window=BRUTE_FORCE_WINDOW, threshold=BRUTE_FORCE_THRESHOLD, spray_threshold=SPRAY_THRESHOLD):
+        # 窗口长度（秒）换算为FILETIME单位
+        self.window = int(window * 10000000)
+        self.threshold = threshold
+        self.spray_threshold = spray_threshold
+        self.pair_attempts = {}
+        self.source_attempts = {}
+        self.source_accounts = {}
+        # 各键最后一次出现的时间，按出现先后排列，用于清理空闲的键
+        self.last_seen = OrderedDict()
+        self.alerts = []
+    
+    def add(self, event):
+        """
+        处理一条事件，返回本条事件触发的告警列表
+        """
+        if not is_failed_logon(event):
+            return []
+        now = event.timestamp
+        horizon = now - self.window
+        self.expire(horizon)
+        
+        source = get_attempt_source(event)
+        account = event.account.lower() if event.account else '-'
+        alerts = []
+        
+        # 暴力破解：同一来源对同一账户的失败次数
+        pair = (source, account)
+        attempts = self.pair_attempts.get(pair)
+        if attempts is None:
+            attempts = self.pair_attempts[pair] = deque()
+        attempts.append(now)
+        while attempts[0] < horizon:
+            attempts.popleft()
+        self.touch(('pair', pair), now)
+        if len(attempts) == self.threshold:
+            alerts.append({
+                '类型': '暴力破解', '来源': source, '账户': account, '次数': len(attempts),
+                '开始时间': format_filetime(attempts[0]), '结束时间': format_filetime(now),
+            })
+        
+        # 密码喷洒：同一来源尝试的不同账户数，counts 记录每个账户在窗口内的尝试次数
+        attempts = self.source_attempts.get(source)
+        if attempts is None:
+            attempts = self.source_attempts[source] = deque()
+            self.source_accounts[source] = {}
+        counts = self.source_accounts[source]
+        attempts.append((now, account))
+        counts[account] = counts.get(account, 0) + 1
+        while attempts[0][0] < horizon:
+            expired = attempts.popleft()[1]
+            counts[expired] -= 1
+            if not counts[expired]:
+                del counts[expired]
+        self.touch(('source', source), now)
+        if len(counts) == self.spray_threshold and counts[account] == 1:
+            alerts.append({
+                '类型': '密码喷洒', '来源': source, '账户数': len(counts),
+                '开始时间': format_filetime(attempts[0][0]), '结束时间': format_filetime(now),
+            })
+        
+        self.alerts.extend(alerts)
+        return alerts
+    
+    def touch(self, key, now):
+        self.last_seen[key] = now
+        self.last_seen.move_to_end(key)
+    
+    def get_state(self):
+        """
+        返回窗口内的失败记录，可以保存为JSON；增量模式下用 set_state 在下次运行时恢复，窗口跨越两次运行
+        """
+        return {
+            'pairs': [[source, account, list(attempts)] for (source, account), attempts in self.pair_attempts.items()],
+            'sources': [[source, [list(attempt) for attempt in attempts]] for source, attempts in self.source_attempts.items()],
+            'last_seen': [[kind, value, seen] for (kind, value), seen in self.last_seen.items()],
+        }
+    
+    def set_state(self, state):
+        self.pair_attempts = {(source, account): deque(attempts) for source, account, attempts in state['pairs']}
+        self.source_attempts = {}
+        self.source_accounts = {}
+        for source, attempts in state['sources']:
+            self.source_attempts[source] = deque((now, account) for now, account in attempts)
+            counts = self.source_accounts[source] = {}
+            for now, account in attempts:
+                counts[account] = counts.get(account, 0) + 1
+        # 键的先后顺序决定清理顺序，按保存时的顺序恢复
+        self.last_seen = OrderedDict(
+            ((kind, tuple(value) if kind == 'pair' else value), seen) for kind, value, seen in state['last_seen']
+        )
+    
+    def expire(self, horizon):
+        """
+        清理最后出现时间早于窗口起点的键
+        """
+        last_seen = self.last_seen
+        while last_seen:
+            key, seen = next(iter(last_seen.items()))
+            if seen >= horizon:
+                break
+            last_seen.popitem(last=False)
+            kind, value = key
+            if kind == 'pair':
+                del self.pair_attempts[value]
+            else:
+                del self.source_attempts[value]
+                del self.source_accounts[value]
+    
+    def active_keys(self):
+        return len(self.last_seen)
+
+def is_failed_logon(event):
+    """
+    判断事件是否为一次登录或认证失败：4625、4771 均为失败，4776 的 Status 不为0时为失败
+    """
+    if event.event_id in (4625, 4771):
+        return True
+    if event.event_id == 4776:
+        status = event.extra.get('Status') if event.extra else None
+        try:
+            return status is not None and int(status, 0) != 0
+        except ValueError:
+            return False
+    return False
+
+def get_attempt_source(event):
+    """
+    获取登录尝试的来源：优先使用IP地址（IPv4映射地址转为IPv4），没有时使用工作站名
+    """
+    ip_address = event.ip_address
+    if ip_address and ip_address != '-':
+        if ip_address.lower().startswith('::ffff:'):
+            ip_address = ip_address[7:]
+        return ip_address
+    workstation = event.workstation or (event.extra.get('Workstation') if event.extra else None)
+    if workstation and workstation != '-':
+        return workstation
+    return '-'
+
+def print_alert(alert):
+    """
+    打印一条告警
+    """
+    if alert['类型'] == '暴力破解':
+        print(f"告警[暴力破解] 来源 {alert['来源']} 对账户 {alert['账户']} 登录失败 {alert['次数']} 次"
+              f"（{alert['开始时间']} - {alert['结束时间']}）")
+    else:
+        print(f"告警[密码喷洒] 来源 {alert['来源']} 尝试了 {alert['账户数']} 个不同账户"
+              f"（{alert['开始时间']} - {alert['结束时间']}）")
+
+class LogonSession:
+    """
+    一次登录会话：登录事件(4624)及与其 TargetLogonId 相同的注销事件(4634/4647)
+    未找到注销事件时 logoff_time 为 None
+    """
+    __slots__ = ('logon_id', 'logon', 'logoff_time', 'logoff_event_id')
+    
+    def __init__(self, logon_id, logon, logoff_time=None, logoff_event_id=None):
+        self.logon_id = logon_id
+        self.logon = logon
+        self.logoff_time = logoff_time
+        self.logoff_event_id = logoff_event_id
+    
+    def duration(self):
+        """
+        会话时长（秒），会话未结束时为 None
+        """
+        if self.logoff_time is None:
+            return None
+        return (self.logoff_time - self.logon.timestamp) / 10000000
+    
+    def to_dict(self):
+        """
+        转换为以中文列名为键的会话信息字典，用于JSON输出
+        """
+        event_info = self.logon.to_dict()
+        del event_info['事件ID']
+        del event_info['事件类型']
+        event_info.pop('TargetLogonId', None)
+        session_info = {
+            '登录时间': event_info.pop('时间'),
+            '注销时间': format_filetime(self.logoff_time) if self.logoff_time is not None else None,
+            '时长(秒)': self.duration(),
+            '状态': '已结束' if self.logoff_time is not None else '未结束',
+            'LogonId': self.logon_id,
+        }
+        session_info.update(event_info)
+        return session_info
+
+class SessionTracker:
+    """
+    用流式哈希连接重建登录会话：按 (来源文件, TargetLogonId) 将 4624 与之后的 4634/4647 配对，事件需要大致按时间顺序输入
+    登录时间早于当前事件 horizon 秒以上仍未注销的会话会被移出并作为未结束会话返回，
+    因此状态只包含最近 horizon 秒内登录且尚未注销的会话
+    """
+    __slots__ = ('horizon', 'open_sessions', 'completed', 'unended', 'unmatched_logoffs')
+    
+    def __init__(self, horizon=SESSION_HORIZON):
+        # 时间范围（秒）换算为FILETIME单位
+        self.horizon = int(horizon * 10000000)
+        # 按登录先后排列的未结束会话
+        self.open_sessions = OrderedDict()
+        self.completed = 0
+        self.unended = 0
+        self.unmatched_logoffs = 0
+    
+    def add(self, event):
+        """
+        处理一条事件，返回因此结束或被移出的会话列表
+        """
+        finished = self.expire(event.timestamp - self.horizon)
+        logon_id = event.extra.get('TargetLogonId') if event.extra else None
+        if logon_id is None:
+            return finished
+        key = (event.source, logon_id)
+        
+        if event.event_id == 4624:
+            # LogonId 被重复使用时，之前的会话视为未结束
+            previous = self.open_sessions.pop(key, None)
+            if previous is not None:
+                self.unended += 1
+                finished.append(previous)
+            self.open_sessions[key] = LogonSession(logon_id, event)
+        elif event.event_id in (4634, 4647):
+            session = self.open_sessions.pop(key, None)
+            if session is None:
+                # 登录发生在分析范围之前，或同一会话的第二个注销事件（4647 之后的 4634）
+                self.unmatched_logoffs += 1
+            else:
+                session.logoff_time = event.timestamp
+                session.logoff_event_id = event.event_id
+                self.completed += 1
+                finished.append(session)
+        return finished
+    
+    def expire(self, horizon):
+        """
+        移出登录时间早于 horizon 的未结束会话
+        """
+        expired = []
+        open_sessions = self.open_sessions
+        while open_sessions:
+            session = next(iter(open_sessions.values()))
+            if session.logon.timestamp >= horizon:
+                break
+            open_sessions.popitem(last=False)
+            expired.append(session)
+        self.unended += len(expired)
+        return expired
+    
+    def flush(self):
+        """
+        分析结束时返回全部仍未结束的会话
+        """
+        remaining = list(self.open_sessions.values())
+        self.open_sessions.clear()
+        self.unended += len(remaining)
+        return remaining
+
+def open_event_db(db_path):
+    """
+    打开（必要时创建）事件数据库，返回 sqlite3 连接
+    """
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(EVENT_DB_SCHEMA)
+    # 旧版本创建的数据库缺少后来加入的字段列，之前导入的记录中这些字段为空
+    columns = set(row[1] for row in conn.execute('PRAGMA table_info(events)'))
+    for name in EVENT_DB_FIELDS:
+        if name not in columns:
+            conn.execute(f'ALTER TABLE events ADD COLUMN {name} TEXT')
+    if 'checkpoint' not in set(row[1] for row in conn.execute('PRAGMA table_info(files)')):
+        conn.execute('ALTER TABLE files ADD COLUMN checkpoint TEXT')
+    # SQLite 的 lower 只处理ASCII，子串匹配使用与 EventFilter 相同的 str.lower
+    conn.create_function('py_lower', 1, lambda value: value.lower() if isinstance(value, str) else value, deterministic=True)
+    return conn
+
+def collect_chunk_events(task):
+    """
+    在工作进程中解析一组数据块中记录号在指定区间内的全部记录，不做筛选
+    task 为 (EVTX文件路径, 数据块序号列表, 记录号区间)
+    返回 ((事件ID, FILETIME, 事件数据, 记录号) 列表, 是否出错)，出错时返回出错之前的记录
+    """
+    evtx_file, chunk_indexes, record_range = task
+    events = []
+    try:
+        with open_worker_evtx(evtx_file) as (buf, file_header):
+            for chunk in iter_chunks(buf, file_header, chunk_indexes):
+                process_records(buf, chunk, None, events, record_range)
+    except Exception as e:
+        logger.warning(f"处理 {evtx_file} 的数据块 {chunk_indexes[0]}-{chunk_indexes[-1]} 时出错: {str(e)}")
+        return events, True
+    return events, False
+
+def ingest_evtx_files(evtx_files, db_path, workers=1):
+    """
+    将EVTX文件中的全部事件导入SQLite数据库，每批数据块在一个事务中插入
+    按 (文件, 记录号) 增量导入：files 表中为每个文件保存与增量模式相同的检查点（见 plan_incremental），
+    只解析检查点之后的新记录，重复记录被忽略。同一路径的日志被清除或轮转时，原有记录保留在改名为
+    "路径@导入时间" 的文件下，新日志从头导入；导入出错时不更新检查点，下次导入会重新处理
+    返回 {文件路径: 新增记录数}
+    """
+    evtx_files = expand_evtx_paths(evtx_files)
+    conn = open_event_db(db_path)
+    insert_sql = (f"INSERT OR IGNORE INTO events (file_id, record_num, timestamp, event_id, {', '.join(EVENT_DB_FIELDS)}) "
+                  f"VALUES ({', '.join('?' * (len(EVENT_DB_FIELDS) + 4))})")
+    inserted = {}
+    pool = None
+    try:
+        for evtx_file in evtx_files:
+            path = os.path.abspath(evtx_file)
+            with conn:
+                conn.execute('INSERT OR IGNORE INTO files (path) VALUES (?)', (path,))
+            file_id, checkpoint = conn.execute('SELECT id, checkpoint FROM files WHERE path = ?', (path,)).fetchone()
+            checkpoint = json.loads(checkpoint) if checkpoint else None
+            if checkpoint is None:
+                # 旧版本导入的文件没有检查点，只能以已导入的最大记录号为准
+                last_record = conn.execute('SELECT MAX(record_num) FROM events WHERE file_id = ?', (file_id,)).fetchone()[0]
+                if last_record:
+                    checkpoint = {'last_record': last_record}
+            
+            with open_evtx(evtx_file) as (buf, file_header):
+                chunk_count = get_chunk_count(buf, file_header)
+                chunk_indexes, record_range, new_checkpoint = plan_incremental(buf, file_header, evtx_file, checkpoint)
+            
+            if checkpoint is not None and record_range[0] < checkpoint['last_record']:
+                # 日志被清除或轮转，保留原有记录，新日志作为新文件从头导入
+                archived = f"{path}@{datetime.now().strftime('%Y%m%d%H%M%S')}"
+                with conn:
+                    conn.execute('UPDATE files SET path = ? WHERE id = ?', (archived, file_id))
+                    file_id = conn.execute('INSERT INTO files (path) VALUES (?)', (path,)).lastrowid
+                logger.warning(f"导入 {evtx_file}: 数据库中原有的记录保留在 {archived} 下，从头导入新日志")
+            
+            logger.info(f"导入 {evtx_file}: 需要解析 {len(chunk_indexes)}/{chunk_count} 个数据块")
+            tasks = [(evtx_file, chunk_indexes[first:first + CHUNKS_PER_TASK], record_range)
+                     for first in range(0, len(chunk_indexes), CHUNKS_PER_TASK)]
+            if pool is None and min(workers or cpu_count(), len(tasks)) > 1:
+                pool = Pool(workers or cpu_count(), init_worker)
+            batches = pool.imap(collect_chunk_events, tasks) if pool is not None else map(collect_chunk_events, tasks)
+            
+            before = conn.total_changes
+            failed = False
+            for events, error in batches:
+                failed = failed or error
+                with conn:
+                    conn.executemany(insert_sql, (
+                        (file_id, record_num, timestamp, event_id) + tuple(data.get(name) for name in EVENT_DB_FIELDS)
+                        for event_id, timestamp, data, record_num in events
+                    ))
+            inserted[evtx_file] = conn.total_changes - before
+            if not failed:
+                with conn:
+                    conn.execute('UPDATE files SET checkpoint = ? WHERE id = ?', (json.dumps(new_checkpoint), file_id))
+            logger.info(f"导入 {evtx_file}: 新增 {inserted[evtx_file]} 条记录")
+            if inserted[evtx_file]:
+                logger.info(f"导入 {evtx_file}: 新增 {update_value_index(conn, file_id)} 个账号和IP取值")
+        
+        # 更新索引统计信息，帮助查询选择合适的索引
+        conn.execute('ANALYZE')
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        conn.close()
+    
+    return inserted
+
+def iter_trigrams(text):
+    """
+    返回文本中所有不同的三元组（连续三个字符）
+    """
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def update_value_index(conn, file_id=None):
+    """
+    将事件中新出现的账号和IP取值加入倒排索引，file_id 指定时只检查该文件的事件
+    返回新增的取值数量
+    """
+    added = 0
+    with conn:
+        for field, columns in VALUE_INDEX_FIELDS.items():
+            for column in columns:
+                sql = f"SELECT DISTINCT {column} FROM events WHERE {column} IS NOT NULL AND {column} != ''"
+                params = ()
+                if file_id is not None:
+                    sql += ' AND file_id = ?'
+                    params = (file_id,)
+                for (value,) in conn.execute(sql, params).fetchall():
+                    cursor = conn.execute('INSERT OR IGNORE INTO field_values (field, value) VALUES (?, ?)', (field, value))
+                    if cursor.rowcount:
+                        value_id = cursor.lastrowid
+                        conn.executemany('INSERT OR IGNORE INTO value_trigrams (trigram, value_id) VALUES (?, ?)',
+                                         ((trigram, value_id) for trigram in iter_trigrams(value.lower())))
+                        added += 1
+    return added
+
+def lookup_field_values(conn, field, needle, watchlist=None):
+    """
+    在倒排索引中查找包含 needle（已转为小写）的账号或IP取值，返回原始取值列表
+    needle 不少于三个字符时对各三元组的倒排列表求交集后逐个确认，否则逐个检查该字段的全部取值
+    needle 为 None 时不按子串筛选；watchlist 指定时取值还需要匹配监视列表
+    两者同时指定时返回同一个取值同时满足两者的结果，查询事件时两者应分别查找（事件的两个账号字段可以各自命中一个）
+    """
+    trigrams = sorted(iter_trigrams(needle)) if needle is not None else None
+    if trigrams:
+        postings = ' INTERSECT '.join(['SELECT value_id FROM value_trigrams WHERE trigram = ?'] * len(trigrams))
+        rows = conn.execute(f'SELECT value FROM field_values WHERE field = ? AND id IN ({postings})', [field] + trigrams)
+    else:
+        rows = conn.execute('SELECT value FROM field_values WHERE field = ?', (field,))
+    return [value for (value,) in rows
+            if (needle is None or needle in value.lower()) and (watchlist is None or watchlist.match(value))]
+
+def build_db_conditions(event_filter, value_tables=False):
+    """
+    将筛选条件转换为SQL条件和参数，用于在数据库中按索引初筛
+    SQL条件只缩小候选范围，最终仍由 match_event 判断，结果与直接解析EVTX文件一致
+    value_tables 为真时账号和IP条件使用临时表 account_values、ip_values 中预先查出的子串匹配取值，
+    监视列表使用临时表 account_watch_values、ip_watch_values 中的取值，两类条件分别判断；
+    否则逐条做子串匹配，监视列表只由 match_event 判断
+    返回 (事件ID和时间条件列表, 参数列表, 其余字段条件列表, 参数列表)
+    """
+    id_time_conditions = []
+    id_time_params = []
+    if event_filter.event_ids is not None:
+        id_time_conditions.append(f"event_id IN ({', '.join('?' * len(event_filter.event_ids))})")
+        id_time_params.extend(sorted(event_filter.event_ids))
+    if event_filter.start_filetime is not None:
+        id_time_conditions.append('timestamp >= ?')
+        id_time_params.append(event_filter.start_filetime)
+    if event_filter.end_filetime is not None:
+        id_time_conditions.append('timestamp <= ?')
+        id_time_params.append(event_filter.end_filetime)
+    
+    field_conditions = []
+    field_params = []
+    if event_filter.logon_types is not None:
+        # 没有登录类型的事件不按登录类型筛选
+        field_conditions.append(f"(LogonType IS NULL OR LogonType = '' OR LogonType IN ({', '.join('?' * len(event_filter.logon_types))}))")
+        field_params.extend(sorted(event_filter.logon_types))
+    if value_tables:
+        if event_filter.target_account is not None:
+            field_conditions.append('(TargetUserName IN temp.account_values OR SubjectUserName IN temp.account_values)')
+        if event_filter.account_watchlist is not None:
+            field_conditions.append('(TargetUserName IN temp.account_watch_values OR SubjectUserName IN temp.account_watch_values)')
+        if event_filter.target_ip is not None:
+            field_conditions.append('IpAddress IN temp.ip_values')
+        if event_filter.ip_watchlist is not None:
+            field_conditions.append('IpAddress IN temp.ip_watch_values')
+        return id_time_conditions, id_time_params, field_conditions, field_params
+    
+    if event_filter.target_account is not None:
+        field_conditions.append('(instr(py_lower(TargetUserName), ?) > 0 OR instr(py_lower(SubjectUserName), ?) > 0)')
+        field_params.extend((event_filter.target_account, event_filter.target_account))
+    if event_filter.target_ip is not None:
+        field_conditions.append('instr(py_lower(IpAddress), ?) > 0')
+        field_params.append(event_filter.target_ip)
+    return id_time_conditions, id_time_params, field_conditions, field_params
+
+def query_event_db(db_path, event_filter=None, evtx_files=None, summary=None, timeline=False):
+    """
+    在事件数据库中按筛选条件查询，逐条返回 EventRecord，每个文件内的顺序与直接解析EVTX文件相同
+    evtx_files 指定时按给出的顺序只查询这些文件的事件，否则按导入顺序查询全部文件；
+    查询多个文件时事件的 source 为来源文件
+    timeline 为真且查询多个文件时，各文件的事件按时间戳（相同时按记录号）排序后归并，按时间顺序返回
+    summary 的内容与 iter_events 相同
+    """
+    if event_filter is None:
+        event_filter = EventFilter()
+    if summary is None:
+        summary = {}
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"事件数据库不存在: {db_path}")
+    missing_fields = [name for name in event_filter.extra_fields if name not in EVENT_DATA_FIELDS]
+    if missing_fields:
+        logger.warning(f"警告: 数据库中没有以下字段，输出中将缺少这些字段: {' '.join(missing_fields)}")
+    
+    conn = open_event_db(db_path)
+    try:
+        file_ids = {path: file_id for file_id, path in conn.execute('SELECT id, path FROM files ORDER BY id')}
+        if evtx_files:
+            paths = [os.path.abspath(evtx_file) for evtx_file in expand_evtx_paths(evtx_files)]
+            missing = [path for path in paths if path not in file_ids]
+            if missing:
+                raise ValueError(f"以下文件尚未导入数据库，请先使用 --ingest-db 导入: {' '.join(missing)}")
+        else:
+            paths = list(file_ids)
+        if not paths:
+            raise ValueError("数据库中没有事件，请先使用 --ingest-db 导入")
+        tag_source = len(paths) > 1
+        
+        # 账号和IP的子串条件及监视列表先在倒排索引中查出全部匹配的取值，再按取值走事件索引
+        # 子串条件和监视列表各用一张临时表：事件的目标账号和主体账号可以分别命中子串条件和监视列表
+        value_conditions = (
+            ('account_values', 'account', event_filter.target_account, None),
+            ('account_watch_values', 'account', None, event_filter.account_watchlist),
+            ('ip_values', 'ip', event_filter.target_ip, None),
+            ('ip_watch_values', 'ip', None, event_filter.ip_watchlist),
+        )
+        value_tables = any(needle is not None or watchlist is not None for table, field, needle, watchlist in value_conditions)
+        if value_tables:
+            if conn.execute('SELECT 1 FROM field_values LIMIT 1').fetchone() is None:
+                # 旧版本导入的数据库还没有倒排索引
+                update_value_index(conn)
+            for table, field, needle, watchlist in value_conditions:
+                conn.execute(f'CREATE TEMP TABLE {table} (value TEXT PRIMARY KEY)')
+                if needle is not None or watchlist is not None:
+                    conn.executemany(f'INSERT INTO temp.{table} (value) VALUES (?)',
+                                     ((value,) for value in lookup_field_values(conn, field, needle, watchlist)))
+        
+        id_time_conditions, id_time_params, field_conditions, field_params = build_db_conditions(event_filter, value_tables)
+        id_time_where = ' AND '.join(['file_id = ?'] + id_time_conditions)
+        where = ' AND '.join(['file_id = ?'] + id_time_conditions + field_conditions)
+        merge = timeline and len(paths) > 1
+        order_by = 'timestamp, record_num' if merge else 'record_num'
+        select_sql = f"SELECT timestamp, event_id, {', '.join(EVENT_DB_FIELDS)} FROM events WHERE {where} ORDER BY {order_by}"
+        
+        # 统计信息：总记录数和各事件ID数量，以及符合事件ID和时间范围的记录数
+        summary.update(total_records=0, total_events=0, filtered_events=0, matched_events=0, event_id_counts={}, files={})
+        for path in paths:
+            file_id = file_ids[path]
+            event_id_counts = dict(conn.execute('SELECT event_id, COUNT(*) FROM events WHERE file_id = ? GROUP BY event_id', (file_id,)))
+            total_events = sum(event_id_counts.values())
+            filtered_events = conn.execute(f'SELECT COUNT(*) FROM events WHERE {id_time_where}', [file_id] + id_time_params).fetchone()[0]
+            summary['files'][path] = {
+                'total_records': total_events, 'total_events': total_events, 'filtered_events': filtered_events,
+                'matched_events': 0, 'event_id_counts': event_id_counts,
+            }
+            for key in ('total_records', 'total_events', 'filtered_events'):
+                summary[key] += summary['files'][path][key]
+            merge_counts(summary['event_id_counts'], event_id_counts)
+        
+        def iter_file_events(path):
+            source = sys.intern(path)
+            file_summary = summary['files'][path]
+            for row in conn.execute(select_sql, [file_ids[path]] + id_time_params + field_params):
+                data = {name: value for name, value in zip(EVENT_DB_FIELDS, row[2:]) if value is not None}
+                if 'LogonType' in data:
+                    data['LogonType'] = str(data['LogonType'])
+                passed, event = match_event(row[1], data, row[0], event_filter)
+                if event is None:
+                    continue
+                if tag_source:
+                    event.source = source
+                summary['matched_events'] += 1
+                file_summary['matched_events'] += 1
+                yield event
+        
+        if merge:
+            # 每个文件一个游标，同时只在内存中保留每个文件的一条事件
+            yield from heapq.merge(*[iter_file_events(path) for path in paths], key=lambda event: event.timestamp)
+        else:
+            for path in paths:
+                yield from iter_file_events(path)
+    finally:
+        conn.close()
+
+def merge_summary(target, summary):
+    """
+    将一次遍历的统计信息累加到目标字典中（跟踪模式下每轮遍历一次）
+    """
+    for key in ('total_records', 'total_events', 'filtered_events', 'matched_events', 'out_of_order_events'):
+        if key in summary:
+            target[key] = target.get(key, 0) + summary[key]
+    merge_counts(target.setdefault('event_id_counts', {}), summary.get('event_id_counts', {}))
+    if 'files' in summary:
+        files = target.setdefault('files', {})
+        for evtx_file, file_summary in summary['files'].items():
+            merge_summary(files.setdefault(evtx_file, {}), file_summary)
+            if 'error' in file_summary:
+                files[evtx_file]['error'] = file_summary['error']
+
+class AggregateOptions:
+    """
+    聚合统计的参数（见 EventAggregator），histogram_interval 单位为秒，top 指定时只保留数量最多的前 top 组
+    统计表代替逐条事件写入输出文件，只支持 json 输出格式
+    """
+    __slots__ = ('group_by', 'distinct_field', 'histogram_interval', 'top')
+    
+    def __init__(self, group_by=None, distinct_field=None, histogram_interval=None, top=None):
+        self.group_by = group_by
+        self.distinct_field = distinct_field
+        self.histogram_interval = histogram_interval
+        self.top = top
+
+class BruteForceOptions:
+    """
+    暴力破解和密码喷洒检测的参数（见 BruteForceDetector），window 单位为秒
+    未指定事件ID时只分析 4625/4771/4776，告警列表代替逐条事件写入输出文件，只支持 json 输出格式
+    """
+    __slots__ = ('window', 'threshold', 'spray_threshold')
+    
+    def __init__(self, window=BRUTE_FORCE_WINDOW, threshold=BRUTE_FORCE_THRESHOLD, spray_threshold=SPRAY_THRESHOLD):
+        self.window = window
+        self.threshold = threshold
+        self.spray_threshold = spray_threshold
+
+class SessionOptions:
+    """
+    会话重建的参数（见 SessionTracker），未指定事件ID时只分析 4624/4634/4647，会话代替逐条事件写入输出文件
+    """
+    __slots__ = ('horizon',)
+    
+    def __init__(self, horizon=SESSION_HORIZON):
+        self.horizon = horizon
+
+class IncrementalOptions:
+    """
+    增量模式的参数：只处理上次运行之后新增的记录，检查点按输出文件分别保存，结果追加到已有输出中
+    follow_interval（秒）指定时为跟踪模式，每隔指定时间处理一次新记录，直到按 Ctrl+C 停止
+    """
+    __slots__ = ('follow_interval',)
+    
+    def __init__(self, follow_interval=None):
+        self.follow_interval = follow_interval
+
+def analyze_events(evtx_files, event_ids=None, logon_types=None, target_account=None, output_file=None, start_time=None, end_time=None, progress_callback=None, target_ip=None, workers=1, preserve_order=True, use_cache=False, output_format='json', extra_fields=None, timeline=False, reorder_window=REORDER_BUFFER_SIZE,
+                   sort=False, memory_budget=DEFAULT_MEMORY_BUDGET, db_path=None, account_watchlist=None, ip_watchlist=None,
+                   aggregate=None, bruteforce=None, sessions=None, incremental=None):
+    """
+    分析Windows事件日志，打印统计信息并将匹配的事件写入输出文件，返回统计信息字典（见 iter_events）
+    db_path 指定时从事件数据库中查询（见 query_event_db），timeline 和 sort 分别见 iter_timeline 和 sort_events
+    aggregate、bruteforce 和 sessions 为 AggregateOptions、BruteForceOptions 和 SessionOptions，最多指定一项，
+    结果保存在返回值的 aggregates、alerts 或 sessions 中；incremental 为 IncrementalOptions 时为增量模式
+    """
+    follow_interval = incremental.follow_interval if incremental is not None else None
+    if incremental is not None and db_path:
+        raise ValueError("增量模式不能用于数据库查询，数据库请使用 --ingest-db 增量导入")
+    if incremental is not None and sessions is not None:
+        # 运行结束时未结束的会话已作为未结束写入输出，之后的运行无法再与注销事件配对
+        raise ValueError("增量模式和跟踪模式不能与会话重建同时使用")
+    
+    if db_path:
+        print(f"正在查询事件数据库: {db_path}")
+        evtx_files = expand_evtx_paths(evtx_files) if evtx_files else []
+    else:
+        print("正在打开EVTX文件...")
+        evtx_files = expand_evtx_paths(evtx_files)
+    for evtx_file in evtx_files:
+        print(f"开始分析事件日志: {evtx_file}")
+    print(f"分析时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    
+    # 聚合用到的非输出字段作为额外字段提取
+    aggregator = None
+    detector = None
+    tracker = None
+    if sum(1 for mode in (aggregate, bruteforce, sessions) if mode is not None) > 1:
+        raise ValueError("聚合统计、暴力破解检测和会话重建不能同时使用")
+    if sessions is not None:
+        if output_file and output_format == 'parquet':
+            raise ValueError("会话重建只支持 json 和 ndjson 输出格式")
+        tracker = SessionTracker(sessions.horizon)
+        event_ids = event_ids or SESSION_EVENT_IDS
+        if 'TargetLogonId' not in (extra_fields or []):
+            extra_fields = list(extra_fields or []) + ['TargetLogonId']
+        # 配对和过期清理需要按时间顺序处理事件
+        preserve_order = True
+        if len(evtx_files) > 1 or db_path:
+            timeline = True
+    elif bruteforce is not None:
+        if output_file and output_format != 'json':
+            raise ValueError("暴力破解检测只支持 json 输出格式")
+        detector = BruteForceDetector(bruteforce.window, bruteforce.threshold, bruteforce.spray_threshold)
+        event_ids = event_ids or BRUTE_FORCE_EVENT_IDS
+        extra_fields = list(extra_fields or []) + [name for name in BRUTE_FORCE_FIELDS if name not in (extra_fields or [])]
+        # 滑动窗口需要按时间顺序处理事件
+        preserve_order = True
+        if len(evtx_files) > 1 or db_path:
+            timeline = True
+    elif aggregate is not None:
+        if output_file and output_format != 'json':
+            raise ValueError("聚合统计只支持 json 输出格式")
+        aggregator = EventAggregator(aggregate.group_by, aggregate.distinct_field, aggregate.histogram_interval)
+        extra_fields = list(extra_fields or [])
+        for name in aggregator.group_by + ((aggregate.distinct_field,) if aggregate.distinct_field else ()):
+            if name not in AGGREGATE_FIELDS and name not in extra_fields:
+                extra_fields.append(name)
+    
+    # 筛选条件只编译一次，并行时随任务传给工作进程
+    event_filter = EventFilter(event_ids, logon_types, target_account, start_time, end_time, target_ip, extra_fields,
+                               account_watchlist, ip_watchlist)
+    if account_watchlist:
+        print(f"账号监视列表: {len(account_watchlist)} 项")
+    if ip_watchlist:
+        print(f"IP监视列表: {len(ip_watchlist)} 项")
+    
+    def report_progress(progress, message):
+        print(message)
+        if progress_callback:
+            progress_callback(progress, message)
+    
+    # 增量模式的检查点与输出文件对应，同一文件写入不同输出时各自记录进度
+    checkpoint_key = None
+    if incremental is not None:
+        checkpoint_key = os.path.abspath(output_file) if output_file else ''
+    
+    # 如果指定了输出文件，匹配的事件逐条写入
+    writer = None
+    if output_file and aggregator is None and detector is None:
+        print(f"分析结果将写入文件: {output_file}")
+        if tracker is not None:
+            # 会话按结束（或被移出）的先后逐条写入
+            writer = BackgroundWriter(open_result_writer(output_file, output_format, append=incremental is not None))
+        else:
+            writer = BackgroundWriter(open_result_writer(output_file, output_format, event_filter.extra_fields, len(evtx_files) != 1,
+                                                         incremental is not None))
+    
+    # 增量模式下恢复上次运行的统计或检测状态，本次的告警接在已有告警之后
+    state_path = None
+    state_options = None
+    previous_alerts = []
+    if incremental is not None and (aggregator is not None or detector is not None):
+        state_path = get_state_path(checkpoint_key)
+        if aggregator is not None:
+            state_options = {'aggregate': [list(aggregator.group_by), aggregate.distinct_field, aggregate.histogram_interval]}
+        else:
+            state_options = {'bruteforce': [bruteforce.window, bruteforce.threshold, bruteforce.spray_threshold]}
+        state = load_analysis_state(state_path, state_options)
+        if state is not None:
+            if aggregator is not None:
+                aggregator.set_state(state['aggregator'])
+            else:
+                detector.set_state(state['detector'])
+                previous_alerts = state['alerts']
+    
+    def save_state(checkpoints):
+        state = {'options': state_options, 'checkpoints': checkpoints}
+        if aggregator is not None:
+            state['aggregator'] = aggregator.get_state()
+        else:
+            state['detector'] = detector.get_state()
+            state['alerts'] = previous_alerts + detector.alerts
+        save_checkpoint(state_path, state)
+    
+    def save_alerts():
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(previous_alerts + detector.alerts, f, ensure_ascii=False, indent=2)
+    
+    summary = {}
+    completed = False
+    try:
+        while True:
+            round_summary = {}
+            if db_path:
+                events = query_event_db(db_path, event_filter, evtx_files, round_summary, timeline)
+            elif timeline:
+                if workers != 1:
+                    print("时间线模式按文件逐块解析，忽略并行进程数设置")
+                events = iter_timeline(evtx_files, event_filter, use_cache, report_progress, round_summary, reorder_window, checkpoint_key)
+            else:
+                events = iter_events(evtx_files, event_filter, workers, preserve_order, use_cache, report_progress, round_summary, checkpoint_key)
+            if sort:
+                events = sort_events(events, memory_budget)
+            for event in events:
+                if aggregator is not None:
+                    aggregator.add(event)
+                if detector is not None:
+                    for alert in detector.add(event):
+                        print_alert(alert)
+                if tracker is not None:
+                    for session in tracker.add(event):
+                        if writer is not None:
+                            writer.write(session)
+                elif writer is not None:
+                    writer.write(event)
+            merge_summary(summary, round_summary)
+            
+            # 本轮的结果写到磁盘后再保存检查点，之前中断时下次运行会重新处理本轮的记录
+            if round_summary.get('checkpoints'):
+                if writer is not None:
+                    writer.mark()
+                if state_path is not None:
+                    save_state(round_summary['checkpoints'])
+                if detector is not None and output_file:
+                    save_alerts()
+                for checkpoint_path, checkpoint in round_summary['checkpoints']:
+                    save_checkpoint(checkpoint_path, checkpoint)
+            elif writer is not None and follow_interval:
+                writer.flush()
+            
+            if not follow_interval:
+                break
+            print(f"本轮匹配 {round_summary['matched_events']} 条事件，{follow_interval} 秒后检查新记录（按 Ctrl+C 停止）")
+            try:
+                time.sleep(follow_interval)
+            except KeyboardInterrupt:
+                print("已停止跟踪")
+                break
+        if tracker is not None:
+            for session in tracker.flush():
+                if writer is not None:
+                    writer.write(session)
+        completed = True
+    finally:
+        if writer is not None:
+            # 增量模式中断时去掉本轮还没有保存检查点的结果，否则下次运行会重复写入这些事件
+            writer.close(rollback=incremental is not None and not completed)
+            
+    print("分析完成")
+    # 打印事件ID统计信息
+    print("\n事件ID统计:")
+    for event_id, count in sorted(summary['event_id_counts'].items(), key=lambda x: x[1], reverse=True):
+        print(f"事件ID {event_id}: {count} 条")
+    
+    if len(evtx_files) > 1 and 'files' in summary:
+        print("\n各文件统计:")
+        for evtx_file, file_summary in summary['files'].items():
+            print(f"{evtx_file}: 总事件数 {file_summary['total_events']}，"
+                  f"符合事件ID筛选 {file_summary['filtered_events']}，匹配 {file_summary['matched_events']}")
+            if file_summary.get('error'):
+                print(f"  出错: {file_summary['error']}")
+            
+    print(f"\n统计信息:")
+    print(f"总事件数: {summary['total_events']}")
+    print(f"符合事件ID筛选的事件数: {summary['filtered_events']}")
+    print(f"最终匹配的事件数: {summary['matched_events']}")
+    failed_files = {evtx_file: file_summary['error'] for evtx_file, file_summary in summary.get('files', {}).items()
+                    if file_summary.get('error')}
+    if failed_files:
+        print(f"\n警告: {len(failed_files)} 个文件分析出错，结果中缺少这些文件（的部分）事件:")
+        for evtx_file, error in failed_files.items():
+            print(f"{evtx_file}: {error}")
+        if len(failed_files) == len(summary['files']) and not summary['total_events']:
+            raise RuntimeError("所有文件都无法分析")
+    if summary.get('out_of_order_events'):
+        print(f"警告: {summary['out_of_order_events']} 条事件的乱序距离超过重排缓冲区，未能按时间排序，可增大 --reorder-window")
+    
+    if tracker is not None:
+        summary['sessions'] = {
+            'completed': tracker.completed, 'unended': tracker.unended, 'unmatched_logoffs': tracker.unmatched_logoffs,
+        }
+        print(f"\n会话重建: 已结束 {tracker.completed} 个，未结束 {tracker.unended} 个，"
+              f"未找到对应登录的注销事件 {tracker.unmatched_logoffs} 条")
+    
+    if detector is not None:
+        summary['alerts'] = detector.alerts
+        print(f"\n暴力破解检测: 共 {len(detector.alerts)} 条告警")
+        if output_file:
+            save_alerts()
+    
+    if aggregator is not None:
+        summary['aggregates'] = aggregator.tables(aggregate.top)
+        print_aggregate_tables(summary['aggregates'])
+        if output_file:
+            with open(output_file, 'w', encoding='utf-8') as f:
+                json.dump(summary['aggregates'], f, ensure_ascii=False, indent=2)
+            
+    if output_file:
+        print(f"\n分析结果已保存到: {output_file}")
+            
+    return summary
+
+def get_event_description(event_id):
+    """
+    获取事件ID的描述
+    """
+    return EVENT_TYPES.get(event_id, "未知事件")
+
+def get_logon_type_description(logon_type):
+    """
+    获取登录类型的描述
+    """
+    return LOGON_TYPES.get(logon_type, "未知登录类型")
+
+def main():
+    parser = argparse.ArgumentParser(description='Windows日志分析工具V1.0')
+    parser.add_argument('evtx_files', nargs='*', help='EVTX日志文件、目录或通配符（可指定多个）')
+    parser.add_argument('--event-ids', type=int, nargs='+', help='要分析的事件ID列表')
+    parser.add_argument('--logon-types', type=int, nargs='+', help='要分析的登录类型列表')
+    parser.add_argument('--account', help='要筛选的特定账号')
+    parser.add_argument('--output', help='输出结果到文件')
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default='json',
+                        help='输出文件格式: json 为JSON数组，ndjson 为每行一个事件，parquet 为列式格式(需要pyarrow) (默认: json)')
+    parser.add_argument('--start-time', help='开始时间 (格式: YYYY-MM-DD HH:MM:SS)')
+    parser.add_argument('--end-time', help='结束时间 (格式: YYYY-MM-DD HH:MM:SS)')
+    parser.add_argument('--list-events', action='store_true', help='列出所有支持的事件ID及其描述')
+    parser.add_argument('--list-logon-types', action='store_true', help='列出所有登录类型及其描述')
+    parser.add_argument('--workers', type=int, default=1, help='并行分析的进程数 (0 表示使用全部CPU核心，默认: 1)')
+    parser.add_argument('--unordered', action='store_true', help='并行分析时不保持记录顺序，按完成先后输出')
+    parser.add_argument('--fields', nargs='+', help='额外输出的事件数据字段，如 SubjectUserName TargetLogonId')
+    parser.add_argument('--cache', action='store_true', help='使用解析事件缓存，同一文件再次查询时无需重新解析')
+    parser.add_argument('--timeline', action='store_true', help='按时间顺序归并所有文件的事件，输出统一时间线')
+    parser.add_argument('--reorder-window', type=int, default=REORDER_BUFFER_SIZE,
+                        help=f'时间线模式下每个文件的重排缓冲区大小，用于纠正文件内的局部乱序 (默认: {REORDER_BUFFER_SIZE})')
+    parser.add_argument('--sort', action='store_true', help='按时间严格排序输出，结果超过内存预算时借助磁盘临时文件排序')
+    parser.add_argument('--memory-budget', type=int, default=DEFAULT_MEMORY_BUDGET // (1024 * 1024),
+                        help=f'排序时匹配结果的内存预算，单位MB (默认: {DEFAULT_MEMORY_BUDGET // (1024 * 1024)})')
+    parser.add_argument('--account-watchlist', metavar='FILE', help='账号监视列表文件，每行一个账号关键字，命中任意一个即匹配')
+    parser.add_argument('--ip-watchlist', metavar='FILE', help='IP监视列表文件，每行一个IP地址或CIDR网段（如 10.0.0.0/8）')
+    parser.add_argument('--group-by', nargs='+', metavar='FIELD',
+                        help='按字段分组计数，如 TargetUserName IpAddress；可用字段: ' + ' '.join(AGGREGATE_FIELDS) + ' 及其他事件数据字段')
+    parser.add_argument('--distinct', metavar='FIELD', help='统计每组中该字段的不同取值数')
+    parser.add_argument('--histogram', type=float, metavar='SECONDS', help='按指定秒数的时间段统计事件数量')
+    parser.add_argument('--top', type=int, metavar='N', help='只显示数量最多的前N组')
+    parser.add_argument('--detect-bruteforce', action='store_true', help='检测暴力破解和密码喷洒（按时间窗口统计4625/4771/4776登录失败）')
+    parser.add_argument('--bf-window', type=float, default=BRUTE_FORCE_WINDOW, metavar='SECONDS',
+                        help=f'暴力破解检测的时间窗口，单位秒 (默认: {BRUTE_FORCE_WINDOW})')
+    parser.add_argument('--bf-threshold', type=int, default=BRUTE_FORCE_THRESHOLD, metavar='N',
+                        help=f'同一来源对同一账户在窗口内失败N次时告警 (默认: {BRUTE_FORCE_THRESHOLD})')
+    parser.add_argument('--spray-threshold', type=int, default=SPRAY_THRESHOLD, metavar='N',
+                        help=f'同一来源在窗口内尝试N个不同账户时告警 (默认: {SPRAY_THRESHOLD})')
+    parser.add_argument('--sessions', action='store_true', help='按 TargetLogonId 配对登录(4624)和注销(4634/4647)事件，输出会话及时长')
+    parser.add_argument('--session-horizon', type=float, default=SESSION_HORIZON, metavar='SECONDS',
+                        help=f'登录超过该时间仍未注销的会话视为未结束并不再跟踪，单位秒 (默认: {SESSION_HORIZON})')
+    parser.add_argument('--incremental', action='store_true',
+                        help='增量模式: 只处理上次运行之后新增的记录，并追加到已有的输出文件（按输出文件记录检查点）')
+    parser.add_argument('--follow', type=float, metavar='SECONDS', help='跟踪模式: 每隔指定秒数处理一次新增的记录，按 Ctrl+C 停止')
+    parser.add_argument('--ingest-db', metavar='DB', help='将EVTX文件中的全部事件增量导入SQLite数据库后退出')
+    parser.add_argument('--query-db', metavar='DB', help='从SQLite数据库中查询事件，不再解析EVTX文件（可用文件参数限定范围）')
+    
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stdout)
+    
+    if args.list_events:
+        print("支持的事件ID列表:")
+        for event_id, desc in sorted(EVENT_TYPES.items()):
+            print(f"{event_id}: {desc}")
+        return
+    
+    if args.list_logon_types:
+        print("登录类型列表:")
+        for logon_type, desc in sorted(LOGON_TYPES.items()):
+            print(f"{logon_type}: {desc}")
+        return
+    
+    if not args.evtx_files and not args.query_db:
+        parser.error("需要指定EVTX日志文件、目录或通配符")
+    
+    if args.ingest_db:
+        try:
+            ingest_evtx_files(args.evtx_files, args.ingest_db, args.workers)
+        except Exception as e:
+            print(f"错误: {str(e)}")
+            import traceback
+            print("详细错误信息:")
+            print(traceback.format_exc())
+            sys.exit(1)
         return
     
     start_time = None
@@ -450,7 +3452,31 @@ def main():
     if args.end_time:
         end_time = datetime.strptime(args.end_time, '%Y-%m-%d %H:%M:%S')
     
-    analyze_events(args.evtx_file, args.event_ids, args.logon_types, args.account, args.output, start_time, end_time)
+    aggregate = None
+    if args.group_by or args.distinct or args.histogram:
+        aggregate = AggregateOptions(args.group_by, args.distinct, args.histogram, args.top)
+    bruteforce = None
+    if args.detect_bruteforce:
+        bruteforce = BruteForceOptions(args.bf_window, args.bf_threshold, args.spray_threshold)
+    sessions = SessionOptions(args.session_horizon) if args.sessions else None
+    incremental = IncrementalOptions(args.follow) if args.incremental or args.follow else None
+    
+    try:
+        analyze_events(args.evtx_files, args.event_ids, args.logon_types, args.account, args.output, start_time, end_time,
+                       workers=args.workers, preserve_order=not args.unordered, use_cache=args.cache,
+                       output_format=args.output_format, extra_fields=args.fields,
+                       timeline=args.timeline, reorder_window=args.reorder_window,
+                       sort=args.sort, memory_budget=args.memory_budget * 1024 * 1024, db_path=args.query_db,
+                       account_watchlist=load_watchlist(args.account_watchlist) if args.account_watchlist else None,
+                       ip_watchlist=load_watchlist(args.ip_watchlist) if args.ip_watchlist else None,
+                       aggregate=aggregate, bruteforce=bruteforce, sessions=sessions, incremental=incremental)
+    except Exception as e:
+        print(f"错误: {str(e)}")
+        import traceback
+        print("详细错误信息:")
+        print(traceback.format_exc())
+        sys.exit(1)
 
 if __name__ == "__main__":
+    mp.freeze_support()
     main() 
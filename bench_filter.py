@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+筛选条件单条记录开销基准测试
+对比原先逐条重复计算的筛选链与预编译的 EventFilter，不需要EVTX文件
+用法: python bench_filter.py [记录数]
+"""
+
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from analyze_windows_events import EventFilter, datetime_to_filetime
+
+def legacy_match(event_id, data, timestamp, event_ids=None, logon_types=None, target_account=None, start_time=None, end_time=None, target_ip=None):
+    """
+    原先 match_event 中的筛选链（不含结果字典的构建）
+    """
+    if timestamp:
+        if start_time and timestamp < start_time:
+            return False
+        if end_time and timestamp > end_time:
+            return False
+    
+    if event_ids and event_id not in event_ids:
+        return False
+    
+    if logon_types and data.get('LogonType'):
+        logon_type = int(data.get('LogonType'))
+        if logon_type not in logon_types:
+            return False
+    
+    if target_account:
+        target_username = data.get('TargetUserName', '')
+        subject_username = data.get('SubjectUserName', '')
+        
+        if not (target_username and target_account.lower() in target_username.lower() or
+               subject_username and target_account.lower() in subject_username.lower()):
+            return False
+    
+    if target_ip:
+        ip_address = data.get('IpAddress', '')
+        if not (ip_address and target_ip.lower() in ip_address.lower()):
+            return False
+    
+    return True
+
+def compiled_match(event_filter, event_id, data, timestamp):
+    """
+    预编译筛选条件的判断，时间戳为FILETIME整数
+    """
+    return event_filter.match_id_and_time(event_id, timestamp) and event_filter.match_fields(data)
+
+def generate_events(count, seed=1):
+    """
+    生成模拟的安全日志事件 (事件ID, 事件数据, datetime时间戳, FILETIME时间戳)
+    """
+    rng = random.Random(seed)
+    accounts = ['administrator', 'alice', 'bob', 'svc_backup', 'SYSTEM', 'DESKTOP-01$']
+    base = datetime(2024, 3, 1)
+    events = []
+    for i in range(count):
+        event_id = rng.choice([4624, 4624, 4624, 4634, 4634, 5156, 4625, 4688])
+        data = {
+            'SubjectUserName': rng.choice(accounts),
+            'TargetUserName': rng.choice(accounts),
+            'TargetDomainName': 'CORP',
+            'LogonType': str(rng.choice([2, 3, 3, 3, 5, 10])),
+            'IpAddress': f"10.0.{rng.randint(0, 3)}.{rng.randint(1, 254)}",
+        }
+        timestamp = base + timedelta(seconds=i)
+        events.append((event_id, data, timestamp, datetime_to_filetime(timestamp)))
+    return events
+
+def run(name, func, events, repeat=5):
+    """
+    多次运行取最快一次，返回每条记录的纳秒数
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        matched = func(events)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    per_record = best / len(events) * 1e9
+    print(f"{name}: {per_record:.0f} 纳秒/条，匹配 {matched} 条")
+    return per_record
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    events = generate_events(count)
+    
+    # 典型的调查条件：指定事件ID、登录类型、账号、IP和时间范围
+    filters = {
+        'event_ids': [4624, 4625],
+        'logon_types': [3, 10],
+        'target_account': 'Admin',
+        'start_time': datetime(2024, 3, 1, 6, 0, 0),
+        'end_time': datetime(2024, 3, 3, 0, 0, 0),
+        'target_ip': '10.0.1.',
+    }
+    event_filter = EventFilter(**filters)
+    
+    print(f"记录数: {count}")
+    legacy = run("原筛选链", lambda items: sum(
+        1 for event_id, data, timestamp, filetime in items if legacy_match(event_id, data, timestamp, **filters)), events)
+    compiled = run("预编译筛选", lambda items: sum(
+        1 for event_id, data, timestamp, filetime in items if compiled_match(event_filter, event_id, data, filetime)), events)
+    print(f"单条记录开销降低: {(1 - compiled / legacy) * 100:.1f}%")
+    
+    if compiled >= legacy:
+        print("预编译筛选没有比原筛选链更快")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
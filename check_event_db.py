@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+事件数据库查询一致性检查
+生成模拟事件写入临时数据库，对比 query_event_db 与逐条 match_event 的结果，
+并检查查询多个文件时暴力破解检测按时间顺序处理事件、4776 事件的认证失败能够从数据库中识别，不需要EVTX文件
+用法: python check_event_db.py
+"""
+
+import io
+import os
+import random
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+
+from analyze_windows_events import (EVENT_DB_FIELDS, BruteForceOptions, EventFilter, analyze_events, datetime_to_filetime,
+                                    match_event, open_event_db, query_event_db)
+
+def generate_events(count, base, seed=1):
+    """
+    生成模拟的安全日志事件 (事件ID, 事件数据, FILETIME时间戳)
+    目标账号和主体账号分别取值，使子串条件和监视列表可以由不同字段命中
+    """
+    rng = random.Random(seed)
+    accounts = ['administrator', 'alice', 'bob', 'svc_backup', 'DC01$', 'DESKTOP-01$']
+    events = []
+    for i in range(count):
+        data = {
+            'SubjectUserName': rng.choice(accounts),
+            'TargetUserName': rng.choice(accounts),
+            'TargetDomainName': 'CORP',
+            'LogonType': str(rng.choice([2, 3, 3, 10])),
+            'IpAddress': rng.choice(['10.0.0.5', '10.0.1.7', '192.168.1.20', '172.16.0.9']),
+        }
+        events.append((rng.choice([4624, 4625, 4634]), data, datetime_to_filetime(base + timedelta(seconds=i))))
+    return events
+
+def create_db(db_path, files):
+    """
+    将 {文件路径: 事件列表} 写入事件数据库，记录号按列表顺序从1开始
+    """
+    conn = open_event_db(db_path)
+    insert_sql = (f"INSERT INTO events (file_id, record_num, timestamp, event_id, {', '.join(EVENT_DB_FIELDS)}) "
+                  f"VALUES ({', '.join('?' * (len(EVENT_DB_FIELDS) + 4))})")
+    with conn:
+        for path, events in files.items():
+            file_id = conn.execute('INSERT INTO files (path) VALUES (?)', (path,)).lastrowid
+            conn.executemany(insert_sql, (
+                (file_id, record_num, timestamp, event_id) + tuple(data.get(name) for name in EVENT_DB_FIELDS)
+                for record_num, (event_id, data, timestamp) in enumerate(events, 1)
+            ))
+    conn.close()
+
+def check_filters(db_path, events):
+    """
+    子串条件与监视列表同时指定时，事件的两个账号字段可以各自命中其中一个
+    """
+    cases = [
+        {'target_account': 'dc01', 'account_watchlist': ['alice']},
+        {'target_account': 'ali', 'account_watchlist': ['svc_']},
+        {'target_account': 'admin'},
+        {'account_watchlist': ['bob', 'DESKTOP']},
+        {'target_ip': '10.0.', 'ip_watchlist': ['10.0.1.0/24']},
+        {'target_ip': '192.', 'ip_watchlist': ['10.0.0.0/8']},
+        {'event_ids': [4624], 'logon_types': [3, 10], 'target_account': 'dc01', 'ip_watchlist': ['172.16.0.0/12']},
+    ]
+    failures = 0
+    for kwargs in cases:
+        expected = sum(1 for event_id, data, timestamp in events
+                       if match_event(event_id, data, timestamp, EventFilter(**kwargs))[1] is not None)
+        actual = sum(1 for event in query_event_db(db_path, EventFilter(**kwargs)))
+        status = "通过" if actual == expected else "失败"
+        print(f"{status}: {kwargs} 数据库 {actual} 条，逐条筛选 {expected} 条")
+        if actual != expected:
+            failures += 1
+    return failures
+
+def check_bruteforce_order(temp_dir):
+    """
+    先导入的文件时间较晚：各文件的事件需要按时间归并后再交给暴力破解检测，告警的开始时间不能晚于结束时间
+    """
+    def failed_logons(day):
+        base = datetime(2024, 1, day, 3, 0, 0)
+        return [(4625, {'TargetUserName': 'alice', 'IpAddress': '10.0.0.5', 'LogonType': '3'},
+                 datetime_to_filetime(base + timedelta(seconds=i * 10))) for i in range(5)]
+    
+    db_path = os.path.join(temp_dir, 'bruteforce.db')
+    create_db(db_path, {
+        os.path.join(temp_dir, 'DC02.evtx'): failed_logons(30),
+        os.path.join(temp_dir, 'DC01.evtx'): failed_logons(1),
+    })
+    with redirect_stdout(io.StringIO()):
+        summary = analyze_events([], db_path=db_path, bruteforce=BruteForceOptions(threshold=5))
+    
+    failures = 0
+    for alert in summary['alerts']:
+        status = "通过" if alert['开始时间'] <= alert['结束时间'] else "失败"
+        print(f"{status}: 告警 {alert['类型']} {alert['开始时间']} - {alert['结束时间']}")
+        if status == "失败":
+            failures += 1
+    if len(summary['alerts']) != 2:
+        print(f"失败: 应有 2 条告警，实际 {len(summary['alerts'])} 条")
+        failures += 1
+    return failures
+
+def check_ntlm_failures(temp_dir):
+    """
+    4776 是否失败由 Status 判断，来源为 Workstation，这两个字段需要保存在数据库中
+    """
+    base = datetime(2024, 2, 1, 3, 0, 0)
+    events = [(4776, {'TargetUserName': 'bob', 'Workstation': 'LAPTOP-7', 'Status': '0xc000006a'},
+               datetime_to_filetime(base + timedelta(seconds=i * 10))) for i in range(5)]
+    events.append((4776, {'TargetUserName': 'bob', 'Workstation': 'LAPTOP-7', 'Status': '0x00000000'},
+                   datetime_to_filetime(base + timedelta(seconds=60))))
+    db_path = os.path.join(temp_dir, 'ntlm.db')
+    create_db(db_path, {os.path.join(temp_dir, 'DC03.evtx'): events})
+    with redirect_stdout(io.StringIO()):
+        summary = analyze_events([], db_path=db_path, bruteforce=BruteForceOptions(threshold=5))
+    
+    alerts = [alert for alert in summary['alerts'] if alert['来源'] == 'LAPTOP-7' and alert['次数'] == 5]
+    status = "通过" if len(summary['alerts']) == 1 and alerts else "失败"
+    print(f"{status}: 4776 认证失败告警 {len(summary['alerts'])} 条")
+    return 0 if status == "通过" else 1
+
+def main():
+    events = generate_events(2000, datetime(2024, 3, 1))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_path = os.path.join(temp_dir, 'events.db')
+        create_db(db_path, {os.path.join(temp_dir, 'Security.evtx'): events})
+        failures = check_filters(db_path, events)
+        failures += check_bruteforce_order(temp_dir)
+        failures += check_ntlm_failures(temp_dir)
+    
+    if failures:
+        print(f"{failures} 项检查失败")
+        sys.exit(1)
+    print("全部检查通过")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+快速路径解码一致性检查
+按Windows实际写入的布局（System 模板中 EventData 为嵌套二进制XML替换值）生成一个数据块，
+逐条对比快速路径与 parse_xml_event 的结果；也可以指定EVTX文件，检查其中的全部记录
+用法: python check_fast_path.py [EVTX文件 ...]
+"""
+
+import sys
+import uuid
+from datetime import datetime, timedelta
+from struct import pack, pack_into
+
+import Evtx.Evtx as evtx
+
+from analyze_windows_events import (CHUNK_SIZE, EVENT_NAMESPACE, datetime_to_filetime, parse_xml_event,
+                                    read_event_fields, read_event_id, read_substitution_array)
+
+class ChunkBuilder:
+    """
+    在内存中生成只含一个数据块的二进制XML，模板和名称字符串在第一次使用时内嵌定义
+    元素为 (名称, [(属性名, 值)], [子节点])，值和子节点为字符串字面值或 ('sub', 序号, 类型)
+    """
+    def __init__(self):
+        self.buf = bytearray(0x200)
+        self.names = {}
+        self.templates = {}
+        self.first_record = None
+        self.last_record = None
+        self.last_offset = 0
+    
+    def name(self, name):
+        if name in self.names:
+            self.buf += pack('<I', self.names[name])
+            return
+        self.names[name] = len(self.buf) + 4
+        self.buf += pack('<I', self.names[name]) + pack('<IHH', 0, 0, len(name)) + name.encode('utf-16-le') + b'\x00\x00'
+    
+    def value(self, value):
+        if isinstance(value, str):
+            self.buf += pack('<BBH', 0x05, 0x01, len(value)) + value.encode('utf-16-le')
+        else:
+            self.buf += pack('<BHB', 0x0D, value[1], value[2])
+    
+    def element(self, node):
+        name, attributes, children = node
+        self.buf += pack('<BH', 0x41 if attributes else 0x01, 0xFFFF)
+        size_offset = len(self.buf)
+        self.buf += b'\x00' * 4
+        self.name(name)
+        if attributes:
+            attributes_offset = len(self.buf)
+            self.buf += b'\x00' * 4
+            for i, (attribute, value) in enumerate(attributes):
+                self.buf.append(0x46 if i < len(attributes) - 1 else 0x06)
+                self.name(attribute)
+                self.value(value)
+            pack_into('<I', self.buf, attributes_offset, len(self.buf) - attributes_offset - 4)
+        if children:
+            self.buf.append(0x02)
+            for child in children:
+                if isinstance(child, list):
+                    self.element(child)
+                else:
+                    self.value(child)
+            self.buf.append(0x04)
+        else:
+            self.buf.append(0x03)
+        pack_into('<I', self.buf, size_offset, len(self.buf) - size_offset - 4)
+    
+    def fragment(self, template_id, node, values):
+        """
+        写入一个二进制XML片段：模板实例和替换值数组；值为 (类型, 数据)，数据可以是写入嵌套片段的函数
+        """
+        self.buf += pack('<BBBBBBI', 0x0F, 0x01, 0x01, 0x00, 0x0C, 0x01, template_id)
+        if template_id in self.templates:
+            self.buf += pack('<I', self.templates[template_id])
+        else:
+            self.templates[template_id] = len(self.buf) + 4
+            self.buf += pack('<II', self.templates[template_id], 0) + pack('<I', template_id) + uuid.uuid4().bytes[4:]
+            size_offset = len(self.buf)
+            self.buf += pack('<IBBBB', 0, 0x0F, 0x01, 0x01, 0x00)
+            self.element(node)
+            self.buf.append(0x00)
+            pack_into('<I', self.buf, size_offset, len(self.buf) - size_offset - 4)
+        
+        self.buf += pack('<I', len(values))
+        descriptors_offset = len(self.buf)
+        self.buf += b'\x00' * (4 * len(values))
+        for i, (value_type, data) in enumerate(values):
+            start = len(self.buf)
+            if callable(data):
+                data()
+            else:
+                self.buf += data
+            pack_into('<HBB', self.buf, descriptors_offset + 4 * i, len(self.buf) - start, value_type, 0)
+    
+    def record(self, record_num, filetime, write):
+        start = len(self.buf)
+        self.buf += b'\x00' * 0x18
+        write()
+        self.buf += b'\x00' * (-(len(self.buf) + 4 - start) % 8)
+        size = len(self.buf) + 4 - start
+        self.buf += pack('<I', size)
+        pack_into('<IIQQ', self.buf, start, 0x2A2A, size, record_num, filetime)
+        if self.first_record is None:
+            self.first_record = record_num
+        self.last_record = record_num
+        self.last_offset = start
+    
+    def finish(self):
+        next_offset = len(self.buf)
+        self.buf += b'\x00' * (CHUNK_SIZE - len(self.buf))
+        pack_into('<8sQQQQIII', self.buf, 0, b'ElfChnk\x00', self.first_record, self.last_record,
+                  self.first_record, self.last_record, 0x80, self.last_offset, next_offset)
+        return self.buf
+
+def system_template():
+    """
+    与Windows安全日志相同的外层模板：事件ID是第3个替换值，EventData 是根元素下第17个替换值（嵌套二进制XML）
+    """
+    return ['Event', [('xmlns', EVENT_NAMESPACE)], [
+        ['System', [], [
+            ['Provider', [('Name', 'Microsoft-Windows-Security-Auditing')], []],
+            ['EventID', [('Qualifiers', ('sub', 4, 0x06))], [('sub', 3, 0x06)]],
+            ['Level', [], [('sub', 0, 0x04)]],
+            ['Keywords', [], [('sub', 5, 0x15)]],
+            ['TimeCreated', [('SystemTime', ('sub', 6, 0x11))], []],
+            ['EventRecordID', [], [('sub', 10, 0x0A)]],
+            ['Channel', [], ['Security']],
+            ['Computer', [], [('sub', 16, 0x01)]],
+        ]],
+        ('sub', 17, 0x21),
+    ]]
+
+def wide(text):
+    return 0x01, text.encode('utf-16-le')
+
+def sid(text):
+    parts = [int(part) for part in text.split('-')[1:]]
+    return 0x13, bytes([parts[0], len(parts) - 2]) + pack('>IH', parts[1] >> 16, parts[1] & 0xFFFF) + pack(f'<{len(parts) - 2}I', *parts[2:])
+
+# 各事件的 EventData 字段及取值，包含字符串、SID、十六进制、整数、GUID 和空值
+SAMPLE_EVENTS = [
+    (4624, [('SubjectUserSid', sid('S-1-5-18')), ('SubjectUserName', wide('DC01$')), ('SubjectLogonId', (0x15, pack('<Q', 0x3E7))),
+            ('TargetUserName', wide('alice')), ('TargetDomainName', wide('CORP')), ('LogonType', (0x08, pack('<I', 3))),
+            ('LogonProcessName', wide('NtLmSsp ')), ('WorkstationName', wide('WS01')), ('LogonGuid', (0x0F, uuid.uuid4().bytes_le)),
+            ('ProcessName', (0x00, b'')), ('IpAddress', wide('10.0.0.5')), ('IpPort', wide('49152'))]),
+    (4625, [('TargetUserName', wide('administrator')), ('Status', (0x14, pack('<I', 0xC000006D))),
+            ('SubStatus', (0x14, pack('<I', 0xC000006A))), ('LogonType', (0x08, pack('<I', 10))), ('IpAddress', wide('192.168.1.20'))]),
+    (4776, [('PackageName', wide('MICROSOFT_AUTHENTICATION_PACKAGE_V1_0')), ('TargetUserName', wide('bob')),
+            ('Workstation', wide('LAPTOP-7')), ('Status', (0x14, pack('<I', 0xC0000064)))]),
+    (4634, None),
+]
+
+def build_sample_chunk():
+    """
+    生成样例数据块，最后一条记录的嵌套 EventData 为空值
+    """
+    builder = ChunkBuilder()
+    base = datetime(2024, 3, 1)
+    for record_num, (event_id, fields) in enumerate(SAMPLE_EVENTS * 2, 1):
+        filetime = datetime_to_filetime(base + timedelta(seconds=record_num))
+        
+        def event_data(event_id=event_id, fields=fields):
+            node = ['EventData', [], [['Data', [('Name', name)], [('sub', i, value[0])]] for i, (name, value) in enumerate(fields)]]
+            builder.fragment(0x3000 + event_id, node, [value for name, value in fields])
+        
+        values = [(0x04, b'\x00'), (0x00, b''), (0x00, b''), (0x06, pack('<H', event_id)), (0x00, b''),
+                  (0x15, pack('<Q', 0x8010000000000000)), (0x11, pack('<Q', filetime))] + [(0x00, b'')] * 3
+        values += [(0x0A, pack('<Q', record_num))] + [(0x00, b'')] * 5 + [wide('DC01.corp.local')]
+        values.append((0x21, event_data) if fields else (0x00, b''))
+        builder.record(record_num, filetime, lambda values=values: builder.fragment(0x2000, system_template(), values))
+    return builder.finish()
+
+def check_chunk(buf, chunk, label):
+    """
+    对比数据块中每条记录的快速路径结果与XML解析结果，返回 (快速路径处理的记录数, 不一致的记录数)
+    """
+    templates = {}
+    names = {}
+    fast = 0
+    failures = 0
+    for record in chunk.records():
+        expected = parse_xml_event(record.xml())
+        located = read_substitution_array(buf, chunk.offset(), record.offset() + 0x18, templates, names)
+        if located is None:
+            continue
+        try:
+            actual = (read_event_id(buf, *located), read_event_fields(buf, chunk.offset(), located, templates, names))
+        except ValueError:
+            continue
+        fast += 1
+        if actual != expected:
+            failures += 1
+            print(f"失败: {label} 记录 {record.record_num()} 快速路径 {actual}，XML解析 {expected}")
+    return fast, failures
+
+def main():
+    failures = 0
+    buf = build_sample_chunk()
+    fast, mismatched = check_chunk(buf, evtx.ChunkHeader(buf, 0), "样例数据块")
+    failures += mismatched
+    total = len(SAMPLE_EVENTS) * 2
+    print(f"{'通过' if fast == total and not mismatched else '失败'}: 样例数据块快速路径处理 {fast}/{total} 条")
+    if fast != total:
+        failures += 1
+    
+    for evtx_file in sys.argv[1:]:
+        with evtx.Evtx(evtx_file) as log:
+            buf = log.get_file_header()._buf
+            fast = 0
+            total = 0
+            for chunk in log.chunks():
+                total += sum(1 for record in chunk.records())
+                chunk_fast, mismatched = check_chunk(buf, chunk, evtx_file)
+                fast += chunk_fast
+                failures += mismatched
+        print(f"{evtx_file}: 快速路径处理 {fast}/{total} 条")
+    
+    if failures:
+        print(f"{failures} 项检查失败")
+        sys.exit(1)
+    print("全部检查通过")
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,8 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from datetime import datetime
-import json
 import sys
+import logging
 import traceback
 import os
 import threading
@@ -15,13 +15,16 @@ import multiprocessing as mp
 from tkcalendar import DateEntry
 
 try:
-    from analyze_windows_events import analyze_events, EVENT_TYPES, LOGON_TYPES
+    from analyze_windows_events import iter_events, EventFilter, BackgroundWriter, open_result_writer, EVENT_TYPES, LOGON_TYPES
 except ImportError as e:
     print(f"导入错误: {str(e)}")
     print("当前工作目录:", os.getcwd())
     print("Python路径:", sys.path)
     sys.exit(1)
 
+# 结果表格中最多显示的事件数，超出的部分只计入统计，全部结果可以保存到输出文件
+MAX_DISPLAY_ROWS = 10000
+
 class TextRedirector:
     def __init__(self, text_widget, queue):
         self.text_widget = text_widget
@@ -176,13 +179,18 @@ class WindowsEventAnalyzerGUI:
             self.output_button.grid(row=5, column=2)
             self.toggle_output()
             
+            # 解析缓存
+            self.use_cache = tk.BooleanVar(value=True)
+            ttk.Checkbutton(self.main_frame, text="使用解析缓存（同一文件再次分析时无需重新解析）",
+                          variable=self.use_cache).grid(row=6, column=0, columnspan=2, sticky=tk.W)
+            
             # 分析按钮
             self.analyze_button = ttk.Button(self.main_frame, text="开始分析", command=self.start_analysis)
-            self.analyze_button.grid(row=6, column=1, pady=20)
+            self.analyze_button.grid(row=7, column=1, pady=20)
             
             # 进度显示框架
             progress_frame = ttk.LabelFrame(self.main_frame, text="分析进度", padding="5")
-            progress_frame.grid(row=7, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=5)
+            progress_frame.grid(row=8, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=5)
             
             # 进度条
             self.progress_var = tk.DoubleVar()
@@ -195,7 +203,7 @@ class WindowsEventAnalyzerGUI:
             
             # 结果显示区域
             result_frame = ttk.LabelFrame(self.main_frame, text="分析结果", padding="5")
-            result_frame.grid(row=8, column=0, columnspan=3, pady=10, sticky=(tk.W, tk.E, tk.N, tk.S))
+            result_frame.grid(row=9, column=0, columnspan=3, pady=10, sticky=(tk.W, tk.E, tk.N, tk.S))
             
             # 创建Treeview
             self.result_tree = ttk.Treeview(result_frame, columns=(
@@ -243,7 +251,7 @@ class WindowsEventAnalyzerGUI:
             
             # 创建统计信息显示区域
             stats_frame = ttk.LabelFrame(self.main_frame, text="统计信息", padding="5")
-            stats_frame.grid(row=9, column=0, columnspan=3, pady=5, sticky=(tk.W, tk.E))
+            stats_frame.grid(row=10, column=0, columnspan=3, pady=5, sticky=(tk.W, tk.E))
             
             self.stats_text = tk.Text(stats_frame, height=3, width=80)
             self.stats_text.grid(row=0, column=0, sticky=(tk.W, tk.E))
@@ -302,12 +310,13 @@ class WindowsEventAnalyzerGUI:
 
     def browse_file(self):
         try:
-            file_path = filedialog.askopenfilename(
+            # 可以同时选择多个文件，路径之间用分号分隔
+            file_paths = filedialog.askopenfilenames(
                 title="选择EVTX日志文件",
                 filetypes=[("EVTX文件", "*.evtx"), ("所有文件", "*.*")]
             )
-            if file_path:
-                self.file_path.set(file_path)
+            if file_paths:
+                self.file_path.set(';'.join(file_paths))
         except Exception as e:
             messagebox.showerror("错误", f"选择文件时出错：{str(e)}")
 
@@ -391,8 +400,9 @@ class WindowsEventAnalyzerGUI:
         for item in self.result_tree.get_children():
             self.result_tree.delete(item)
         
-        # 添加新的结果
-        for result in results:
+        # 添加新的结果，显示时才转换为中文列名的字典
+        for event in results:
+            result = event.to_dict()
             self.result_tree.insert("", "end", values=(
                 result.get("时间", ""),
                 result.get("事件ID", ""),
@@ -405,11 +415,13 @@ class WindowsEventAnalyzerGUI:
                 result.get("登录类型", "")
             ))
 
-    def update_stats(self, event_id_counts, total_events, filtered_events):
-        """更新统计信息"""
+    def update_stats(self, event_id_counts, total_events, filtered_events, displayed=None):
+        """更新统计信息，displayed 为结果表格中显示的事件数"""
         self.stats_text.delete(1.0, tk.END)
         self.stats_text.insert(tk.END, f"总事件数: {total_events}\n")
         self.stats_text.insert(tk.END, f"符合筛选条件的事件数: {filtered_events}\n\n")
+        if displayed is not None and displayed < filtered_events:
+            self.stats_text.insert(tk.END, f"结果表格只显示前 {displayed} 条，全部结果请保存到输出文件\n\n")
         self.stats_text.insert(tk.END, "事件ID统计:\n")
         for event_id, count in sorted(event_id_counts.items()):
             self.stats_text.insert(tk.END, f"事件ID {event_id}: {count} 条\n")
@@ -456,52 +468,48 @@ class WindowsEventAnalyzerGUI:
             # 开始分析
             self.root.after(0, lambda: self.update_progress(10, "正在打开EVTX文件..."))
             
-            # 创建临时文件用于保存结果
-            temp_file = "temp_result.json"
-            
-            # 统计信息变量
-            event_id_counts = {}
-            total_events = 0
-            filtered_events = 0
-            
-            analyze_events(
-                self.file_path.get(),
+            event_filter = EventFilter(
                 event_ids,
                 logon_types,
                 self.account.get() if self.use_account.get() else None,
-                temp_file,  # 使用临时文件
                 start_time,
                 end_time,
-                progress_callback=self.update_progress,
-                target_ip=self.ip.get() if self.use_ip.get() else None  # 添加IP筛选
+                self.ip.get() if self.use_ip.get() else None  # 添加IP筛选
             )
             
-            # 读取分析结果
-            if os.path.exists(temp_file):
-                with open(temp_file, 'r', encoding='utf-8') as f:
-                    results = json.load(f)
+            # 如果需要保存到指定文件，边分析边写入
+            # 文件框中可以填写多个文件、目录或通配符，用分号分隔
+            evtx_files = [path.strip() for path in self.file_path.get().split(';') if path.strip()]
+            
+            writer = None
+            if self.use_output.get() and self.output_file.get():
+                writer = BackgroundWriter(open_result_writer(self.output_file.get()))
                     
-                # 计算统计信息
-                filtered_events = len(results)
-                event_id_counts = {}
-                for event in results:
-                    event_id = event.get('事件ID')
-                    if event_id:
-                        event_id_counts[event_id] = event_id_counts.get(event_id, 0) + 1
-                
-                # 更新结果显示
-                self.root.after(0, lambda: self.update_results(results))
-                
-                # 更新统计信息
-                self.root.after(0, lambda: self.update_stats(event_id_counts, total_events, filtered_events))
+            # 直接遍历分析结果，表格只保留前 MAX_DISPLAY_ROWS 条（保持记录顺序），其余的只写入输出文件
+            results = []
+            summary = {}
+            try:
+                for event in iter_events(
+                    evtx_files,
+                    event_filter,
+                    workers=mp.cpu_count(),  # 按数据块并行解析
+                    use_cache=self.use_cache.get(),
+                    progress_callback=lambda value, message: self.root.after(0, lambda: self.update_progress(value, message)),
+                    summary=summary
+                ):
+                    if len(results) < MAX_DISPLAY_ROWS:
+                        results.append(event)
+                    if writer is not None:
+                        writer.write(event)
+            finally:
+                if writer is not None:
+                    writer.close()
                 
-                # 如果需要保存到指定文件
-                if self.use_output.get() and self.output_file.get():
-                    with open(self.output_file.get(), 'w', encoding='utf-8') as f:
-                        json.dump(results, f, ensure_ascii=False, indent=2)
+            # 更新结果显示
+            self.root.after(0, lambda: self.update_results(results))
                 
-                # 删除临时文件
-                os.remove(temp_file)
+            # 更新统计信息
+            self.root.after(0, lambda: self.update_stats(summary['event_id_counts'], summary['total_events'], summary['matched_events'], len(results)))
             
             # 更新进度到100%
             self.root.after(0, lambda: self.update_progress(100, "分析完成！"))
@@ -551,6 +559,8 @@ class WindowsEventAnalyzerGUI:
 def main():
     try:
         print("正在启动GUI...")
+        # 分析库的提示信息通过 logging 输出，打印到控制台
+        logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stdout)
         # 设置多进程启动方法
         if sys.platform == 'darwin':  # macOS
             mp.set_start_method('fork')
@@ -569,4 +579,5 @@ def main():
         messagebox.showerror("错误", f"程序启动失败：{str(e)}")
 
 if __name__ == "__main__":
+    mp.freeze_support()
     main() 